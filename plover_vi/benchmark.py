@@ -0,0 +1,254 @@
+#!/bin/python
+"""
+Benchmarks for plover_vi.
+
+Everything runs offline on synthetic data generated from a fixed seed, so results of different runs
+(with the same --size and --seed) are comparable. The results can be written as JSON,
+and compared against the results of a previous run (the baseline) to catch regressions.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+from typing import List, Optional, Callable, Dict, Any
+
+from plover_vi import library
+
+import_time_budget: float=0.010
+# seconds to import plover_vi.dictionary when Plover loads it,
+# excluding the lazily loaded tables (which are loaded on the first lookup)
+
+plover_loaded_modules: List[str]=["plover_vi.initialize_independent_script", "plover.log", "plover.oslayer.config"]
+# modules that are already imported inside Plover (for initialize_independent_script: where the system is
+# already set up, so that importing it does nothing; outside Plover, it sets up the system, which is slow)
+
+
+def construct_all()->List[Optional[str]]:
+	return [
+			library.construct(onset, nucleus, coda, tone, new_tone_placement)
+			for new_tone_placement in (False, True)
+			for onset in library.onsets
+			for nucleus in library.nucleuses
+			for coda in library.codas
+			for tone in library.tones
+			]
+
+def construct_all_unicodedata()->List[Optional[str]]:
+	"""
+	Same as construct_all, but with the tone functions from before add_tone_table was introduced.
+	"""
+	add_tone=library.add_tone
+	library.add_tone=library.add_tone_unicodedata
+	try:
+		return construct_all()
+	finally:
+		library.add_tone=add_tone
+
+def add_tone_all(add_tone: Callable[[str, str], str])->List[str]:
+	return [add_tone(vowel, tone) for vowel in library.vowels for tone in library.tones]
+
+def measure_import_time(module: str, preloaded: List[str], repeat: int)->float:
+	"""
+	Return the best cumulative import time (in seconds) of module, as reported by python -X importtime
+	in a fresh interpreter where the preloaded modules are already imported.
+
+	The bytecode is cached in a temporary directory by a first run that is not counted,
+	so the time of compiling the source is not included.
+	"""
+	environment=dict(os.environ)
+	environment.pop("PYTHONDONTWRITEBYTECODE", None)
+	code="; ".join(f"import {name}" for name in [*preloaded, module])
+	times: List[float]=[]
+	with tempfile.TemporaryDirectory() as pycache_prefix:
+		for _ in range(repeat+1):
+			stderr=subprocess.run(
+					[sys.executable, "-X", "importtime", "-X", f"pycache_prefix={pycache_prefix}", "-c", code],
+					env=environment, capture_output=True, text=True, check=True).stderr
+			for line in stderr.splitlines():
+				fields=line.split("|")
+				if len(fields)==3 and fields[2].strip()==module:
+					times.append(int(fields[1])*1e-6)
+	if len(times)!=repeat+1:
+		raise RuntimeError(f"{module} is already imported by {preloaded}")
+	return min(times[1:])
+
+def measure(function: Callable, repeat: int)->float:
+	"""
+	Return the best time (in seconds) of a single call to function.
+	"""
+	return min(timeit.repeat(function, number=1, repeat=repeat))
+
+def synthetic_frequency(size: int, seed: int)->Dict[str, int]:
+	"""
+	Return a bigram frequency list like the output of bigram_frequency, with size random bigrams of syllables
+	(some capitalized) and Zipf-distributed counts, most common first.
+	"""
+	from plover_vi.decompose import decompose
+	random_=random.Random(seed)
+	syllables=sorted(decompose)
+	result: Dict[str, int]={}
+	while len(result)<size:
+		word=random_.choice(syllables)+" "+random_.choice(syllables)
+		if random_.random()<0.1:
+			word=word.capitalize()
+		result.setdefault(word, 10**6//(len(result)+1))
+	return result
+
+Benchmarks=Dict[str, Callable[[], Any]]
+
+def benchmarks(size: int, seed: int)->Benchmarks:
+	"""
+	Return {name: function to be timed}, after preparing the data the functions need.
+	"""
+	from plover_vi import decompose, dictionary, generate_brief
+	from plover_vi import construct_2_syllable_brief_system as brief_system
+	from plover_vi.stroke import Stroke
+
+	random_=random.Random(seed)
+	frequency=synthetic_frequency(size, seed)
+
+	brief=generate_brief.generate(frequency)
+	dictionary.two_word_brief.index=dictionary.brief_index_from_mapping(brief)
+	simple_strokes: List[str]=[
+			str(Stroke.from_integer(stroke))
+			for stroke in random_.sample(sorted(dictionary.get_simple_syllable_table()), 1000)]
+	brief_strokes: List[str]=[
+			str(Stroke.from_integer(stroke)|dictionary.star_mask|disambiguation)
+			for stroke, words in random_.sample(list(dictionary.two_word_brief.index.items()), 250)
+			for disambiguation in dictionary.right_disambiguation_index]
+	rejected_strokes: List[str]=[
+			# extra key, no brief, no vowel
+			*[str(Stroke(stroke)|Stroke("-D")) for stroke in simple_strokes[:400]],
+			*[str(Stroke(stroke)|dictionary.star_mask) for stroke in simple_strokes[400:700]
+				if not dictionary.two_word_brief.index.words(int(Stroke(stroke)))],
+			*[str(Stroke(stroke)-dictionary.vowel_mask) for stroke in simple_strokes[700:]],
+			]
+
+	frequency_parts_mapped, old_word, part_frequency=brief_system.parts_frequency(frequency)
+	part_compression=[brief_system.CompressionSequence(frequency) for frequency in part_frequency]
+	partitions=list(dict.fromkeys(brief_system.hand_written_partitions))
+
+	result: Benchmarks={
+			"add_tone": lambda: add_tone_all(library.add_tone),
+			"add_tone_unicodedata": lambda: add_tone_all(library.add_tone_unicodedata),
+			"construct_all": construct_all,
+			"construct_all_unicodedata": construct_all_unicodedata,
+			"decompose_build": decompose.build,
+			"lookup_simple_1000": lambda: [dictionary.lookup([stroke]) for stroke in simple_strokes],
+			"lookup_brief_1000": lambda: [dictionary.lookup([stroke]) for stroke in brief_strokes],
+			"lookup_rejected_1000": lambda: [dictionary.lookup([stroke]) for stroke in rejected_strokes],
+			"generate_brief": lambda: generate_brief.generate(frequency),
+			"generate_brief_stream": lambda: generate_brief.generate_stream(frequency.items()),
+			"evaluate_partitions_python": lambda: (
+				brief_system.PythonEvaluator(frequency_parts_mapped, part_compression).evaluate(partitions)),
+			}
+	if brief_system.numpy is not None:
+		result["evaluate_partitions_array"]=lambda: (
+			brief_system.ArrayEvaluator(frequency_parts_mapped, part_compression).evaluate(partitions))
+	return result
+
+def run(benchmarks: Benchmarks, repeat: int)->Dict[str, float]:
+	"""
+	Return {name: best time in seconds}.
+	"""
+	return {name: measure(function, repeat) for name, function in benchmarks.items()}
+
+def environment()->Dict[str, str]:
+	return {
+			"python": sys.version,
+			"implementation": platform.python_implementation(),
+			"machine": platform.machine(),
+			"platform": platform.platform(),
+			}
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float)->List[str]:
+	"""
+	Return the names of the benchmarks that are slower than in baseline by more than the tolerance ratio.
+	"""
+	return [
+			name for name, time in results.items()
+			if name in baseline and time>baseline[name]*(1+tolerance)]
+
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Run the benchmarks for plover_vi."
+			)
+	parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions of each benchmark.")
+	parser.add_argument("--import-time", action="store_true",
+			help="Only measure the import time of plover_vi.dictionary, "
+			f"and exit with status 1 if it's over the budget of {import_time_budget*1000:.0f} ms")
+	parser.add_argument("--size", type=int, default=20000,
+			help="Number of bigrams in the synthetic frequency list")
+	parser.add_argument("--seed", type=int, default=0,
+			help="Random seed for the synthetic data")
+	parser.add_argument("--only", nargs="+", default=None, metavar="NAME",
+			help="Only run these benchmarks")
+	parser.add_argument("--output", default=None,
+			help="Write the results as JSON to this file")
+	parser.add_argument("--baseline", default=None,
+			help="Compare against the results in this file (written by --output of a previous run), "
+			"and exit with status 1 if some benchmark is slower")
+	parser.add_argument("--tolerance", type=float, default=0.2,
+			help="With --baseline, a benchmark is slower if its time is more than (1+this) times the baseline")
+	args=parser.parse_args()
+
+	if args.import_time:
+		import_time=measure_import_time("plover_vi.dictionary", plover_loaded_modules, args.repeat)
+		print(f"import plover_vi.dictionary: {import_time*1000:.1f} ms (budget: {import_time_budget*1000:.0f} ms)")
+
+		from plover_vi import dictionary
+		first_use_time=sum(
+				measure(function, args.repeat)
+				for function in (
+					dictionary.two_word_brief.load,
+					dictionary.multi_word_brief.load,
+					dictionary.load_simple_syllable_table,
+					))
+		print(f"tables loaded on first lookup: {first_use_time*1000:.1f} ms")
+		sys.exit(import_time>import_time_budget)
+
+	assert construct_all()==construct_all_unicodedata()
+	assert add_tone_all(library.add_tone)==add_tone_all(library.add_tone_unicodedata)
+
+	selected=benchmarks(args.size, args.seed)
+	if args.only is not None:
+		unknown=set(args.only)-selected.keys()-{"import_dictionary"}
+		if unknown:
+			parser.error(f"unknown benchmarks: {sorted(unknown)}")
+		selected={name: function for name, function in selected.items() if name in args.only}
+	results=run(selected, args.repeat)
+	if args.only is None or "import_dictionary" in args.only:
+		results["import_dictionary"]=measure_import_time("plover_vi.dictionary", plover_loaded_modules, args.repeat)
+
+	baseline: Dict[str, float]={}
+	if args.baseline is not None:
+		with open(args.baseline) as f:
+			baseline=json.load(f)["results"]
+	for name, time in results.items():
+		line=f"{name:30} {time*1000:10.3f} ms"
+		if name in baseline:
+			line+=f" {time/baseline[name]:6.2f}x baseline"
+		print(line)
+
+	if args.output is not None:
+		with open(args.output, "w") as f:
+			json.dump({
+				"environment": environment(),
+				"size": args.size,
+				"seed": args.seed,
+				"repeat": args.repeat,
+				"results": results,
+				}, f, indent=1)
+
+	regressions=compare(results, baseline, args.tolerance)
+	if regressions:
+		print(f"slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+		sys.exit(1)
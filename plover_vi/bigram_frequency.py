@@ -1,26 +1,237 @@
 #!/bin/python
 # does not filter upper/lowercase
 #
-# might consume a lot of memory and take some time
-# for the Wikipedia dump file viwiki-latest-pages-articles-multistream3.xml-p3452086p4565246
-# (170 MiB, download from https://dumps.wikimedia.org/viwiki/latest/
+# the input is read in chunks, so the memory usage is proportional to the number of distinct bigrams
+# rather than to the input size.
+# it can read the Wikipedia dump files directly (.xml or .bz2), for example
+# viwiki-latest-pages-articles-multistream3.xml-p3452086p4565246.bz2
+# (download from https://dumps.wikimedia.org/viwiki/latest/
 #  read instructions from https://en.wikipedia.org/wiki/Wikipedia:Database_download#Where_do_I_get_it? )
-# it consumes 4GiB of RAM and takes half a minute
 
 
 
 import re
 import sys
+import bz2
 import json
+import os
+import codecs
+import functools
+import multiprocessing
 from collections import Counter
+from typing import Iterable, Iterator, Tuple, TextIO, BinaryIO, List, Optional, Dict, Union, Callable, TypeVar
 
-data_=sys.stdin.read()
-data=re.split(r"(\w+)", data_)
-# 1, 3, ...: word
-# 0, 2, ...: non-word
-result=Counter(
-		data[split_index-1]+' '+data[split_index+1]
-		for split_index in range(2, len(data)-2, 2)
-		if data[split_index].isspace())
-json.dump(dict(result.most_common()), sys.stdout,
-		indent=0, ensure_ascii=False)
+from plover_vi.heavy_hitters import SpaceSaving
+
+token_pattern=re.compile(r"(\w+)|(\W+)")
+
+def open_input(path: str)->TextIO:
+	if path=="-":
+		return sys.stdin
+	if path.endswith(".bz2"):
+		return bz2.open(path, "rt", encoding="u8")
+	return open(path, encoding="u8")
+
+def read_chunks(file: TextIO, chunk_size: int)->Iterator[str]:
+	while True:
+		chunk=file.read(chunk_size)
+		if not chunk:
+			return
+		yield chunk
+
+def iterate_tokens(chunks: Iterable[str])->Iterator[Tuple[str, str]]:
+	"""
+	Split the text formed by concatenating chunks into tokens.
+	Each token is (word, "") or ("", non-word).
+
+	The last token of each chunk might continue in the next chunk, so it's carried over.
+	"""
+	carry=""
+	for chunk in chunks:
+		tokens=token_pattern.findall(carry+chunk)
+		if not tokens:
+			continue
+		carry="".join(tokens.pop())
+		yield from tokens
+	yield from token_pattern.findall(carry)
+
+def iterate_words(chunks: Iterable[str])->Iterator[Tuple[str, bool]]:
+	"""
+	Yield (word, joined) for each word in the text formed by concatenating chunks,
+	where joined is whether the word is separated from the previous word by whitespace only.
+	"""
+	previous_is_word=False
+	joined=False
+	for word, separator in iterate_tokens(chunks):
+		if word:
+			yield word, joined
+			previous_is_word=True
+		else:
+			joined=previous_is_word and separator.isspace()
+			previous_is_word=False
+
+def iterate_bigrams(words: Iterable[Tuple[str, bool]])->Iterator[str]:
+	previous=""
+	for word, joined in words:
+		if joined:
+			yield previous+' '+word
+		previous=word
+
+Task=Tuple[str, int, Optional[int]]
+# (path, start, end): byte range [start, end) of the file, or the whole file if end is None
+
+safe_boundary_pattern=re.compile(b"[%s]"%re.escape(bytes(
+		byte for byte in range(0x21, 0x7f)
+		if not (chr(byte).isalnum() or chr(byte)=="_"))))
+# ASCII characters that are neither word characters nor whitespace.
+# No bigram spans a position right after one of them.
+
+def find_boundary(file: BinaryIO, position: int, block_size: int=1<<16)->Optional[int]:
+	"""
+	Return the first safe position to split the file at, that is not before position.
+	Return None if there's none.
+	"""
+	file.seek(position)
+	while True:
+		block=file.read(block_size)
+		if not block:
+			return None
+		match=safe_boundary_pattern.search(block)
+		if match:
+			return position+match.end()
+		position+=len(block)
+
+def split_file(path: str, split_size: Optional[int])->List[Task]:
+	"""
+	Split the file into byte ranges of approximately split_size bytes at safe boundaries.
+	Compressed files and stdin are not split.
+	"""
+	if split_size is None or path=="-" or path.endswith(".bz2"):
+		return [(path, 0, None)]
+	result: List[Task]=[]
+	with open(path, "rb") as file:
+		start=0
+		while True:
+			end=find_boundary(file, start+split_size)
+			if end is None:
+				result.append((path, start, os.path.getsize(path)))
+				return result
+			result.append((path, start, end))
+			start=end
+
+def read_task_chunks(task: Task, chunk_size: int)->Iterator[str]:
+	path, start, end=task
+	if end is None:
+		with open_input(path) as file:
+			yield from read_chunks(file, chunk_size)
+		return
+	decoder=codecs.getincrementaldecoder("u8")()
+	with open(path, "rb") as file:
+		file.seek(start)
+		remaining=end-start
+		while remaining:
+			data=file.read(min(chunk_size, remaining))
+			if not data:
+				break
+			remaining-=len(data)
+			yield decoder.decode(data)
+	yield decoder.decode(b"", final=True)
+
+BigramCounter=TypeVar("BigramCounter", Counter, SpaceSaving)
+
+def count_task(task: Task, chunk_size: int, new_counter: Callable[[], BigramCounter])->BigramCounter:
+	result=new_counter()
+	result.update(iterate_bigrams(iterate_words(read_task_chunks(task, chunk_size))))
+	return result
+
+def count_tasks(tasks: List[Task], chunk_size: int, jobs: int,
+		new_counter: Callable[[], BigramCounter])->BigramCounter:
+	"""
+	new_counter is Counter for exact counts, or creates a SpaceSaving for approximate counts.
+
+	In the former case, the result is identical to counting the tasks serially, including the order of the keys.
+	"""
+	result=new_counter()
+	if jobs==1:
+		for task in tasks:
+			result.update(count_task(task, chunk_size, new_counter))
+		return result
+	with multiprocessing.Pool(jobs) as pool:
+		for counter in pool.imap(functools.partial(count_task, chunk_size=chunk_size, new_counter=new_counter), tasks):
+			result.update(counter)
+	return result
+
+def compare(exact: Counter, approximate: SpaceSaving, k: int)->Dict[str, Union[int, float]]:
+	"""
+	Compare the top k items of approximate against the exact counts.
+	"""
+	exact_top=[item for item, count in exact.most_common(k)]
+	approximate_top=approximate.most_common(k)
+	relative_errors=[
+			(count-exact[item])/exact[item]
+			for item, count, error in approximate_top if exact[item]]
+	return {
+			"k": k,
+			"capacity": approximate.capacity,
+			"recall": len(set(exact_top)&{item for item, count, error in approximate_top})/max(1, len(exact_top)),
+			"bounds_hold": all(count-error<=exact[item]<=count for item, count, error in approximate_top),
+			"guaranteed": sum(
+				count-error>=approximate_top[-1][1]
+				for item, count, error in approximate_top[:-1]) if approximate_top else 0,
+			"max_relative_error": max(relative_errors, default=0.),
+			"mean_relative_error": sum(relative_errors)/max(1, len(relative_errors)),
+			}
+
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Count bigrams (pairs of words separated by whitespace) in the input files, "
+			"output the frequency list to stdout."
+			)
+	parser.add_argument("files", nargs="*", default=["-"],
+			help="Input files (.bz2 files are decompressed). Bigrams spanning two files are not counted. "
+			"'-' means stdin")
+	parser.add_argument("--chunk-size", type=int, default=1<<16,
+			help="Number of characters (or bytes, for split files) to read at a time")
+	parser.add_argument("--jobs", "-j", type=int, default=1,
+			help="Number of worker processes")
+	parser.add_argument("--split-size", type=int, default=None,
+			help="Split uncompressed input files into byte ranges of approximately this size, "
+			"to be counted in parallel. Smaller ranges also reduce the peak memory usage of each worker, "
+			"which is proportional to the number of distinct bigrams in a range")
+	parser.add_argument("--top", type=int, default=None,
+			help="Only output the most common bigrams, with approximate counts. "
+			"Requires --capacity")
+	parser.add_argument("--capacity", type=int, default=None,
+			help="Number of bigrams to keep track of in approximate mode. "
+			"Each takes roughly 200 bytes. The larger, the more accurate")
+	parser.add_argument("--bounds", default=None,
+			help="In approximate mode, write [bigram, lower bound, upper bound] of each output bigram "
+			"to this file")
+	parser.add_argument("--compare", action="store_true",
+			help="In approximate mode, also count exactly and print a comparison report to stderr")
+	args=parser.parse_args()
+
+	tasks: List[Task]=[task for path in args.files for task in split_file(path, args.split_size)]
+	if args.top is None:
+		result=count_tasks(tasks, args.chunk_size, args.jobs, Counter)
+		json.dump(dict(result.most_common()), sys.stdout,
+				indent=0, ensure_ascii=False)
+	else:
+		if args.capacity is None:
+			parser.error("--top requires --capacity")
+		approximate=count_tasks(tasks, args.chunk_size, args.jobs,
+				functools.partial(SpaceSaving, args.capacity))
+		top=approximate.most_common(args.top)
+		json.dump({item: count for item, count, error in top}, sys.stdout,
+				indent=0, ensure_ascii=False)
+		if args.bounds is not None:
+			with open(args.bounds, "w", encoding="u8") as f:
+				json.dump([[item, count-error, count] for item, count, error in top], f,
+						indent=0, ensure_ascii=False)
+		if args.compare:
+			exact=count_tasks(tasks, args.chunk_size, args.jobs, Counter)
+			json.dump(compare(exact, approximate, args.top), sys.stderr, indent=1)
@@ -0,0 +1,244 @@
+"""
+Compiled format of the two-word brief file, indexed by stroke.
+
+The words of each brief are stored at the slot given by the bits of the brief stroke under slot_mask
+(left consonant, vowel/glide and right consonant), with the runs of bits of slot_mask packed together.
+The file is memory-mapped, so loading it doesn't parse anything, and a lookup doesn't build
+any string other than the words it returns.
+
+Layout (unsigned 32-bit integers in native byte order, then bytes):
+	header: magic, version, slot_mask, slot_count, word_count, pool_size
+	slot_offsets[slot_count+1]: the word IDs of slot s are word_ids[slot_offsets[s]:slot_offsets[s+1]]
+	word_ids[slot_offsets[slot_count]]
+	string_offsets[word_count+1]: word i is pool[string_offsets[i]:string_offsets[i+1]] in UTF-8
+	pool[pool_size]
+Each distinct word is stored once in the pool.
+
+The file at the configured path only contains the name of the data file, which is in the same directory
+and named after the hash of its content (see write). So a new version is written to a new file,
+and the data file a running instance has mapped is never replaced
+(which fails on Windows, where a mapped file can't be replaced or deleted).
+"""
+import mmap
+import re
+import struct
+from array import array
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, List, Tuple, Iterator, Union
+
+from plover_vi import library
+
+magic: int=0x42495650  # b"PVIB" in little endian; also detects a file written with another byte order
+version: int=1
+header=struct.Struct("=6I")
+
+Runs=List[Tuple[int, int]]
+# [(shift, mask)]: bits (stroke>>shift)&mask of the slot come from the stroke
+
+def slot_runs(slot_mask: int)->Runs:
+	"""
+	Split slot_mask into runs of consecutive bits, which are packed together in the slot, lowest first.
+	"""
+	result: Runs=[]
+	slot_bits=0
+	bit=0
+	while slot_mask>>bit:
+		if slot_mask>>bit&1:
+			length=0
+			while slot_mask>>(bit+length)&1:
+				length+=1
+			result.append((bit-slot_bits, ((1<<length)-1)<<slot_bits))
+			slot_bits+=length
+			bit+=length
+		else:
+			bit+=1
+	return result
+
+def to_slot(stroke: int, runs: Runs)->int:
+	slot=0
+	for shift, mask in runs:
+		slot|=stroke>>shift&mask
+	return slot
+
+def from_slot(slot: int, runs: Runs)->int:
+	stroke=0
+	for shift, mask in runs:
+		stroke|=(slot&mask)<<shift
+	return stroke
+
+def slot_count(runs: Runs)->int:
+	return 1<<sum(bin(mask).count("1") for shift, mask in runs)
+
+
+class BriefIndex:
+	"""
+	{slot: words}, in memory. Built from the JSON source format.
+	"""
+
+	def __init__(self, slot_mask: int, slots: Dict[int, List[str]])->None:
+		self.slot_mask: int=slot_mask
+		self.runs: Runs=slot_runs(slot_mask)
+		self.slots: Dict[int, List[str]]=slots
+
+	def words(self, stroke: int)->Sequence:
+		"""
+		Return the words of the brief of stroke (only the bits under slot_mask are used), most preferred first.
+		"""
+		return self.slots.get(to_slot(stroke, self.runs), ())
+
+	def items(self)->Iterator[Tuple[int, Sequence]]:
+		"""
+		Yield (stroke, words) for each slot that has some words, where stroke only has bits under slot_mask.
+		"""
+		for slot, words in self.slots.items():
+			if words:
+				yield from_slot(slot, self.runs), words
+
+
+class CompiledWords(Sequence):
+	"""
+	The words of one slot of a compiled file, decoded on access.
+	"""
+	__slots__=("brief", "start", "stop")
+
+	def __init__(self, brief: "CompiledBriefIndex", start: int, stop: int)->None:
+		self.brief=brief
+		self.start=start
+		self.stop=stop
+
+	def __len__(self)->int:
+		return self.stop-self.start
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in range(*i.indices(len(self)))]
+		if i<0:
+			i+=len(self)
+		if not 0<=i<len(self):
+			raise IndexError(i)
+		return self.brief.word(self.brief.word_ids[self.start+i])
+
+
+class CompiledBriefIndex(BriefIndex):
+	"""
+	A memory-mapped compiled file.
+	"""
+
+	def __init__(self, path: Union[str, Path], slot_mask: int)->None:
+		"""
+		Raise ValueError if the file is malformed or was compiled for another slot_mask.
+		"""
+		with open(path, "rb") as file:
+			self.data=mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		if len(self.data)<header.size:
+			raise ValueError("Malformed compiled brief file")
+		magic_, version_, slot_mask_, slot_count_, word_count, pool_size=header.unpack_from(self.data)
+		if magic_!=magic or version_!=version:
+			raise ValueError("Not a compiled brief file, or compiled by another version")
+		if slot_mask_!=slot_mask:
+			raise ValueError("Compiled brief file has another slot mask")
+
+		self.slot_mask=slot_mask
+		self.runs=slot_runs(slot_mask)
+		if slot_count_!=slot_count(self.runs):
+			raise ValueError("Malformed compiled brief file")
+
+		view=memoryview(self.data)
+		position=header.size
+		def take(count: int)->memoryview:
+			nonlocal position
+			start=position
+			position+=count*4
+			return view[start:position].cast("I")
+		self.slot_offsets=take(slot_count_+1)
+		self.word_ids=take(self.slot_offsets[-1])
+		self.string_offsets=take(word_count+1)
+		self.pool=view[position:position+pool_size]
+		if position+pool_size!=len(self.data) or self.string_offsets[-1]!=pool_size:
+			raise ValueError("Malformed compiled brief file")
+
+	def word(self, id_: int)->str:
+		return str(self.pool[self.string_offsets[id_]:self.string_offsets[id_+1]], "u8")
+
+	def words(self, stroke: int)->Sequence:
+		slot=to_slot(stroke, self.runs)
+		return CompiledWords(self, self.slot_offsets[slot], self.slot_offsets[slot+1])
+
+	def items(self)->Iterator[Tuple[int, Sequence]]:
+		slot_offsets=self.slot_offsets
+		for slot in range(len(slot_offsets)-1):
+			if slot_offsets[slot]!=slot_offsets[slot+1]:
+				yield from_slot(slot, self.runs), CompiledWords(self, slot_offsets[slot], slot_offsets[slot+1])
+
+
+def compile_index(index: BriefIndex)->bytes:
+	runs=slot_runs(index.slot_mask)
+	ids: Dict[str, int]={}
+	slot_offsets=array("I", [0])
+	word_ids=array("I")
+	for slot in range(slot_count(runs)):
+		for word in index.slots.get(slot, ()):
+			word_ids.append(ids.setdefault(word, len(ids)))
+		slot_offsets.append(len(word_ids))
+
+	string_offsets=array("I", [0])
+	pool=bytearray()
+	for word in ids:
+		pool+=word.encode("u8")
+		string_offsets.append(len(pool))
+
+	return b"".join((
+		header.pack(magic, version, index.slot_mask, len(slot_offsets)-1, len(ids), len(pool)),
+		slot_offsets.tobytes(),
+		word_ids.tobytes(),
+		string_offsets.tobytes(),
+		pool,
+		))
+
+def data_path_pattern(path: Path)->"re.Pattern[str]":
+	return re.compile(re.escape(path.stem)+r"\.[0-9a-f]{16}"+re.escape(path.suffix))
+
+def data_path(path: Union[str, Path])->Path:
+	"""
+	Return the path of the data file named by the file at path.
+	Raise ValueError if the file doesn't name a data file.
+	"""
+	path=Path(path)
+	with open(path, "rb") as file:
+		name=file.read(256).decode("u8", "replace")
+	if not data_path_pattern(path).fullmatch(name):
+		raise ValueError("Not a compiled brief file, or compiled by another version")
+	return path.with_name(name)
+
+def load(path: Union[str, Path], slot_mask: int)->CompiledBriefIndex:
+	"""
+	Map the data file named by the file at path.
+	Raise OSError or ValueError (see CompiledBriefIndex) if it can't be loaded.
+	"""
+	return CompiledBriefIndex(data_path(path), slot_mask)
+
+def write(path: Union[str, Path], index: BriefIndex)->None:
+	"""
+	Write the data file under a new name, then point the file at path to it atomically,
+	so a running instance never maps a partially written file, and its mapped file is left alone.
+
+	The data files of previous versions are deleted, except those that are still mapped on Windows,
+	which are deleted by a later write.
+	"""
+	import hashlib  # only needed to write, so the plugin doesn't load it
+	path=Path(path)
+	data=compile_index(index)
+	new_data_path=path.with_name(f"{path.stem}.{hashlib.sha256(data).hexdigest()[:16]}{path.suffix}")
+	if not new_data_path.exists():
+		# otherwise it has the same content, and may be mapped
+		library.write_atomically(new_data_path, data)
+	library.write_atomically(path, new_data_path.name.encode("u8"))
+
+	pattern=data_path_pattern(path)
+	for old_data_path in path.parent.iterdir():
+		if old_data_path!=new_data_path and pattern.fullmatch(old_data_path.name):
+			try:
+				old_data_path.unlink()
+			except OSError:
+				pass
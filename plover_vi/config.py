@@ -1,5 +1,20 @@
 from pathlib import Path
+from typing import Optional
 
 from plover.oslayer.config import CONFIG_DIR  # type: ignore
 
 two_word_brief_default_path: Path=Path(CONFIG_DIR)/"wordlist_vi.json"
+two_word_brief_compiled_path: Path=Path(CONFIG_DIR)/"wordlist_vi.bin"
+# compiled by generate_brief --compiled, used instead of the JSON file unless it's older
+# (it names the data file written next to it, see plover_vi.compiled_brief)
+multi_word_brief_path: Path=Path(CONFIG_DIR)/"multiwordlist_vi.json"
+multi_word_brief_compiled_path: Path=Path(CONFIG_DIR)/"multiwordlist_vi.bin"
+# same as above, for briefs of 3 or more words (generate_brief --multi-word)
+brief_reload_interval: Optional[float]=1.
+# seconds between checks for changes of the brief files, or None to never reload them
+use_simple_syllable_table: bool=True
+decompose_cache_path: Path=Path(CONFIG_DIR)/"plover_vi_decompose_cache.bin"
+simple_syllable_table_cache_path: Path=Path(CONFIG_DIR)/"plover_vi_simple_syllable_table_cache.bin"
+lookup_stats_path: Optional[Path]=None
+# if set, record statistics of the lookups and write them to this path, see plover_vi.instrumentation
+# (the environment variable PLOVER_VI_STATS takes precedence)
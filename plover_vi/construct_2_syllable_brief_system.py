@@ -1,103 +1,594 @@
 #!/bin/python
 # heuristic, repeatedly merge least common until fit.
 
-import operator
+import hashlib
+import heapq
 import json
 import itertools
 import sys
-from typing import Dict, Mapping, List, Optional, Tuple
+import time
+import datetime
+import random
+import multiprocessing
+from typing import Dict, Mapping, List, Optional, Tuple, Iterator, Union, NamedTuple, Callable, TextIO, Type
 from collections import Counter, defaultdict
-import argparse
 from tempfile import gettempdir
 from pathlib import Path
+from math import ceil, log2, exp
 
 from plover_vi.decompose import decompose
 
-parser=argparse.ArgumentParser(
-		formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-		usage="Search through two-word brief systems."
-		)
-parser.add_argument("frequency_file", help="Path to JSON frequency file.")
-parser.add_argument("output_log_directory", help="Path to temporary log file output directory",
-		nargs="?", default=gettempdir())
-parser.add_argument("--search-all", "-a", help="Search all possible partitions. "
-		"If this argument is not set, the list of partitions to search in the source code "
-		"should also be modified", action="store_true")
-args=parser.parse_args()
+try:
+	import numpy  # type: ignore
+except ImportError:
+	numpy=None  # type: ignore
 
 Parts=Tuple[str, ...]
+Partition=Tuple[int, ...]
+
+def load_frequency(path: str, limit: int=10000)->Tuple[Dict[Parts, int], Dict[Parts, str], List[Counter]]:
+	"""
+	Return (frequency_parts_mapped, old_word, part_frequency) for the first limit bigrams in the frequency file.
+	"""
+	frequency: Dict[str, int]=json.load(open(path))
+	return parts_frequency(dict(list(frequency.items())[:limit]))
+
+def parts_frequency(frequency: Dict[str, int])->Tuple[Dict[Parts, int], Dict[Parts, str], List[Counter]]:
+	"""
+	Same as load_frequency, for all the bigrams in frequency.
+	"""
+	part_frequency: List[Counter]=[Counter() for _ in range(8)]
+	frequency_parts_mapped: Dict[Parts, int]=Counter()
+	old_word={}
+	for word, count in frequency.items():
+		a0, b0=word.split()
+		try:
+			a, b=decompose[a0.lower()], decompose[b0.lower()]
+		except KeyError:
+			continue
+		parts: Parts=(a.onset, a.nucleus, a.coda, a.tone, b.onset, b.nucleus, b.coda, b.tone)
+		# ignore tone placement... (so there might be overlaps)
+		#assert parts not in old_word, ((word, a, b), old_word[parts])
+		old_word[parts]=word
+		frequency_parts_mapped[parts]+=count
+		for i in range(8):
+			part_frequency[i][parts[i]]+=count
+	return frequency_parts_mapped, old_word, part_frequency
+
 
-frequency: Dict[str, int]=json.load(open(args.frequency_file))
-frequency=dict(list(frequency.items())[:10000])
-part_frequency: List[Counter]=[Counter() for _ in range(8)]
-frequency_parts_mapped: Dict[Parts, int]=Counter()
-old_word={}
-for word, count in frequency.items():
-	a0, b0=word.split()
-	try:
-		a, b=decompose[a0.lower()], decompose[b0.lower()]
-	except KeyError:
-		continue
-	parts: Parts=(a.onset, a.nucleus, a.coda, a.tone, b.onset, b.nucleus, b.coda, b.tone)
-	# ignore tone placement... (so there might be overlaps)
-	#assert parts not in old_word, ((word, a, b), old_word[parts])
-	old_word[parts]=word
-	frequency_parts_mapped[parts]+=count
-	for i in range(8):
-		part_frequency[i][parts[i]]+=count
-
-
-MergedCounter=List[Tuple[Parts, int]]
 MergeMapping=Mapping[str,
 		#Parts
 		int # some unique identifier
 		]
 
-def compression_sequence(frequency: Mapping[str, int])->List[MergeMapping]:
-	result: List[MergedCounter]=[[] for _ in range(len(frequency)+1)]
-	result[-1]=[
-			((key,), value)
-			for key, value in frequency.items()]
-	for i in range(len(result)-1, 1, -1):
-		cur=result[i]
-		result[i]=sorted(cur, key=operator.itemgetter(1))
-		key1, value1=cur[0]
-		key2, value2=cur[1]
-		result[i-1]=[(key1+key2, value1+value2), *cur[2:]]
-	assert len(result[1])==1
-	assert not result[0]
+class CompressionSequence:
+	"""
+	Result of repeatedly merging the two least common groups of keys, until there's only one group left.
+	Ties are broken in favor of the most recently merged group, then the order in frequency.
+
+	self[level] is the mapping from each key to its group ID when there are level groups left
+	(level 0 is an empty mapping).
+	Only the merge history is stored, each level is computed on request in O(n).
+	"""
+
+	def __init__(self, frequency: Mapping[str, int])->None:
+		self.keys: List[str]=list(frequency)
+		self.merges: List[Tuple[int, int]]=[]
+		# (representative key index of group 1, representative key index of group 2)
+
+		heap: List[Tuple[int, int, int]]=[
+				(count, order, order)  # (count, tie breaker, representative key index)
+				for order, count in enumerate(frequency.values())]
+		heapq.heapify(heap)
+		while len(heap)>1:
+			count1, _, representative1=heapq.heappop(heap)
+			count2, _, representative2=heapq.heappop(heap)
+			self.merges.append((representative1, representative2))
+			heapq.heappush(heap, (count1+count2, -len(self.merges), representative1))
+
+	def __len__(self)->int:
+		return len(self.keys)+1
+
+	def group_ids(self, level: int)->List[int]:
+		"""
+		Return the group ID of each key (in the order of the keys), from 0 to level-1.
+		"""
+		assert 0<=level<len(self)
+		if level==0:
+			return []
+		parent=list(range(len(self.keys)))
+		def find(x: int)->int:
+			while parent[x]!=x:
+				parent[x]=parent[parent[x]]
+				x=parent[x]
+			return x
+		for representative1, representative2 in self.merges[:len(self.keys)-level]:
+			parent[find(representative2)]=find(representative1)
+		root_ids: Dict[int, int]={}
+		return [root_ids.setdefault(find(index), len(root_ids)) for index in range(len(self.keys))]
+
+	def __getitem__(self, level: int)->MergeMapping:
+		return dict(zip(self.keys, self.group_ids(level)))
+
+
+def all_partitions(part_frequency: List[Counter], total_bits: int=22)->List[Partition]:
+	# assumption: 11 independent bits each hand => 22 in total
 	return [
-			{
-				key: index
-				for index, (keys, count) in enumerate(merged_counter)
-				for key in keys}
-			for merged_counter in result
-			]
-
-part_compression=[compression_sequence(frequency) for frequency in part_frequency]
-
-#import readline
-#import code
-#code.interact(local=locals())
-
-# assumption: 11 independent bits each hand => 22 in total
-from math import ceil, log2
-partitions=[
-		partition
-		for partition in itertools.product(*(
-			range(0, ceil(log2(len(part_frequency[i]))-1e-10)+1)
-			for i in range(8)
-			))
-		if sum(partition)==22]
+			partition
+			for partition in itertools.product(*(
+				range(0, ceil(log2(len(part_frequency[i]))-1e-10)+1)
+				for i in range(8)
+				))
+			if sum(partition)==total_bits]
 
-import time
-import datetime
-start_time=time.time()
-import random
-random.shuffle(partitions)
+def partition_compression(part_compression: List[CompressionSequence], partition: Partition)->List[MergeMapping]:
+	return [part_compression[i][min(len(part_compression[i])-1, 2**partition[i])] for i in range(8)]
+
+def remap(parts: Parts, cur_part_compression: List[MergeMapping])->Tuple[int, ...]:
+	return tuple(
+		cur_index_part_compression[part]
+		for part, cur_index_part_compression in zip(parts, cur_part_compression)
+		)
+
+def count_conflicts(frequency_parts_mapped: Dict[Parts, int], cur_part_compression: List[MergeMapping])->int:
+	distinct_values={remap(parts, cur_part_compression) for parts, count in frequency_parts_mapped.items()}
+	# disregard frequency for now...
+	return len(frequency_parts_mapped)-len(distinct_values)
+
+def write_log(path: Path, frequency_parts_mapped: Dict[Parts, int], old_word: Dict[Parts, str],
+		cur_part_compression: List[MergeMapping])->None:
+	frequency_list: List[Tuple[Parts, int]]=sorted(
+			frequency_parts_mapped.items(), key=lambda x: x[1], reverse=True)
+	data_: Dict[Tuple[int, ...], List[Tuple[str, int]]]=defaultdict(list)
+	for parts_, count in frequency_list:
+		data_[
+				remap(parts_, cur_part_compression)
+				].append((
+					old_word[parts_],
+					count))
+	with open(path, "w") as f:
+		data_2=[
+				#[word for word, count in words]
+				words
+				for words in 
+				sorted(
+					[words for words in data_.values() if len(words)!=1]
+					, key=lambda words: words[1][1], reverse=True)
+				]
+
+		f.write("[\n")
+		for index, item in enumerate(data_2):
+			if index!=0:
+				f.write(",\n")
+			json.dump(
+					item,
+					f,
+					ensure_ascii=False,
+					#indent=0
+					)
+		f.write("\n]")
+
+
+Evaluation=Tuple[int, int]
+# (conflict_count, weighted_conflict_count)
+# weighted_conflict_count is the total frequency of the words that are not the most frequent one
+# among those mapped to the same value
+
+class PythonEvaluator:
+	def __init__(self, frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence])->None:
+		self.frequency_parts_mapped=frequency_parts_mapped
+		self.part_compression=part_compression
+
+	def evaluate(self, partitions: List[Partition])->List[Evaluation]:
+		result: List[Evaluation]=[]
+		for partition in partitions:
+			cur_part_compression=partition_compression(self.part_compression, partition)
+			maximum_count: Dict[Tuple[int, ...], int]={}
+			for parts, count in self.frequency_parts_mapped.items():
+				value=remap(parts, cur_part_compression)
+				maximum_count[value]=max(maximum_count.get(value, 0), count)
+			result.append((
+				len(self.frequency_parts_mapped)-len(maximum_count),
+				sum(self.frequency_parts_mapped.values())-sum(maximum_count.values()),
+				))
+		return result
+
+class ArrayEvaluator:
+	"""
+	Same as PythonEvaluator, but with NumPy.
+
+	Each word is encoded as a row of the 8 key indices of its parts,
+	and each part at each level as an array of group IDs, so a partition
+	maps all words at once to a single integer per word.
+	"""
+	def __init__(self, frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence])->None:
+		self.part_compression=part_compression
+		key_indices=[
+				{key: index for index, key in enumerate(compression.keys)}
+				for compression in part_compression]
+		self.codes=numpy.array(
+				[[key_indices[i][part] for i, part in enumerate(parts)] for parts in frequency_parts_mapped],
+				dtype=numpy.int64).reshape(-1, 8)
+		self.counts=numpy.array(list(frequency_parts_mapped.values()), dtype=numpy.int64)
+		self.group_id_arrays: Dict[Tuple[int, int], "numpy.ndarray"]={}
+
+	def group_id_array(self, i: int, level: int)->"numpy.ndarray":
+		try:
+			return self.group_id_arrays[i, level]
+		except KeyError:
+			result=self.group_id_arrays[i, level]=numpy.array(self.part_compression[i].group_ids(level), dtype=numpy.int64)
+			return result
+
+	def evaluate(self, partitions: List[Partition])->List[Evaluation]:
+		result: List[Evaluation]=[]
+		total_count=int(self.counts.sum())
+		for partition in partitions:
+			value=numpy.zeros(len(self.counts), dtype=numpy.int64)
+			for i in range(8):
+				level=min(len(self.part_compression[i])-1, 2**partition[i])
+				value=value*level+self.group_id_array(i, level)[self.codes[:, i]]
+			order=numpy.lexsort((-self.counts, value))
+			sorted_value=value[order]
+			first=numpy.ones(len(order), dtype=bool)
+			first[1:]=sorted_value[1:]!=sorted_value[:-1]
+			distinct=int(first.sum())
+			result.append((
+				len(order)-distinct,
+				total_count-int(self.counts[order][first].sum()),
+				))
+		return result
+
+Evaluator=Union[PythonEvaluator, ArrayEvaluator]
+
+def make_evaluator(frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence])->Evaluator:
+	if numpy is None:
+		return PythonEvaluator(frequency_parts_mapped, part_compression)
+	return ArrayEvaluator(frequency_parts_mapped, part_compression)
+
+
+worker_evaluator: Optional[Evaluator]=None
+
+def init_worker(frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence])->None:
+	"""
+	The tables are sent once to each worker process, instead of once per partition.
+	"""
+	global worker_evaluator
+	worker_evaluator=make_evaluator(frequency_parts_mapped, part_compression)
+
+def evaluate(partitions: List[Partition])->List[Tuple[Partition, Evaluation]]:
+	assert worker_evaluator is not None
+	return list(zip(partitions, worker_evaluator.evaluate(partitions)))
+
+def inputs_hash(frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence])->str:
+	"""
+	Hash of everything the evaluation of a partition depends on
+	(so it changes with the frequency file, the limit on the number of bigrams and the syllable decomposition).
+	"""
+	h=hashlib.sha256()
+	h.update(json.dumps([[list(parts), count] for parts, count in frequency_parts_mapped.items()],
+		ensure_ascii=False).encode('u8'))
+	h.update(json.dumps([[compression.keys, compression.merges] for compression in part_compression],
+		ensure_ascii=False).encode('u8'))
+	return h.hexdigest()
+
+def read_checkpoint(path: Path, expected_hash: str)->Dict[Partition, Evaluation]:
+	"""
+	The checkpoint file has a JSON header line {"inputs_hash": ...} (see inputs_hash),
+	then one JSON line [partition, conflict_count, weighted_conflict_count] per evaluated partition.
+	A partially written last line (if the process was killed) is ignored.
 
-if not args.search_all:
-	partitions=[
+	Raise ValueError if the checkpoint was written for other inputs.
+	"""
+	result: Dict[Partition, Evaluation]={}
+	try:
+		with open(path) as f:
+			header=f.readline()
+			if not header.endswith("\n"):
+				# empty, or killed while writing the header
+				return result
+			try:
+				hash_=json.loads(header)["inputs_hash"]
+			except (ValueError, TypeError, KeyError):
+				hash_=None
+			if hash_!=expected_hash:
+				raise ValueError(f"Checkpoint file {path} was written for another frequency file or options, "
+						"delete it or use another checkpoint file")
+			for line in f:
+				try:
+					partition, conflict_count, weighted_conflict_count=json.loads(line)
+				except ValueError:
+					continue
+				result[tuple(partition)]=(conflict_count, weighted_conflict_count)
+	except FileNotFoundError:
+		pass
+	return result
+
+def open_checkpoint(path: Path, hash_: str)->TextIO:
+	"""
+	Open the checkpoint file for appending, writing the header if it's new.
+	read_checkpoint must have been called on it first, so an existing header is known to match.
+	"""
+	try:
+		with open(path) as f:
+			has_header=f.readline().endswith("\n")
+	except FileNotFoundError:
+		has_header=False
+	if has_header:
+		return open(path, "a")
+	f=open(path, "w")
+	f.write(json.dumps({"inputs_hash": hash_})+"\n")
+	f.flush()
+	return f
+
+def search(partitions: List[Partition], frequency_parts_mapped: Dict[Parts, int],
+		part_compression: List[CompressionSequence], checkpoint_path: Optional[Path], jobs: int,
+		batch_size: int=64)->Dict[Partition, Evaluation]:
+	"""
+	Return {partition: evaluation} for all partitions.
+
+	Results already in the checkpoint file are reused, new results are appended to it as soon as they're available.
+	Raise ValueError if the checkpoint file was written for other inputs (see read_checkpoint).
+	"""
+	hash_=inputs_hash(frequency_parts_mapped, part_compression)
+	result=read_checkpoint(checkpoint_path, hash_) if checkpoint_path is not None else {}
+	remaining=[partition for partition in partitions if partition not in result]
+	print(f"{len(partitions)-len(remaining)} / {len(partitions)} partitions read from checkpoint", file=sys.stderr)
+	batches=[remaining[i:i+batch_size] for i in range(0, len(remaining), batch_size)]
+
+	checkpoint=open_checkpoint(checkpoint_path, hash_) if checkpoint_path is not None else None
+	start_time=time.time()
+	last_report_time=start_time
+	done=0
+	def results()->Iterator[List[Tuple[Partition, Evaluation]]]:
+		if jobs==1:
+			init_worker(frequency_parts_mapped, part_compression)
+			yield from map(evaluate, batches)
+			return
+		with multiprocessing.Pool(jobs, initializer=init_worker,
+				initargs=(frequency_parts_mapped, part_compression)) as pool:
+			yield from pool.imap_unordered(evaluate, batches)
+	try:
+		for batch_result in results():
+			for partition, evaluation in batch_result:
+				result[partition]=evaluation
+				if checkpoint is not None:
+					checkpoint.write(json.dumps([partition, *evaluation])+"\n")
+			if checkpoint is not None:
+				checkpoint.flush()
+			done+=len(batch_result)
+			now=time.time()
+			if now-last_report_time>=10 or done==len(remaining):
+				last_report_time=now
+				print(
+						done, "/", len(remaining),
+						":",
+						datetime.timedelta(
+							seconds=
+							(now-start_time)/done*(len(remaining)-done)
+							),
+						"remaining",
+						file=sys.stderr)
+	finally:
+		if checkpoint is not None:
+			checkpoint.close()
+	return result
+
+def benchmark_evaluators(frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence],
+		partitions: List[Partition])->None:
+	"""
+	Compare the evaluators against the original loop (count_conflicts).
+	"""
+	start_time=time.time()
+	expected=[
+			count_conflicts(frequency_parts_mapped, partition_compression(part_compression, partition))
+			for partition in partitions]
+	print(f"count_conflicts: {time.time()-start_time:.3f}s")
+	evaluators: List[Type[Evaluator]]=[PythonEvaluator]
+	if numpy is not None:
+		evaluators.append(ArrayEvaluator)
+	weighted=None
+	for evaluator_class in evaluators:
+		start_time=time.time()
+		evaluations=evaluator_class(frequency_parts_mapped, part_compression).evaluate(partitions)
+		print(f"{evaluator_class.__name__}: {time.time()-start_time:.3f}s")
+		assert [conflict_count for conflict_count, weighted_conflict_count in evaluations]==expected
+		assert weighted is None or weighted==evaluations
+		weighted=evaluations
+
+def max_bits(compression: CompressionSequence)->int:
+	return ceil(log2(max(1, len(compression.keys)))-1e-10)
+
+class System(NamedTuple):
+	partition: Partition
+	group_ids: Tuple[Tuple[int, ...], ...]
+	# group_ids[i][k]: group ID of the k-th key of part i (in the order of CompressionSequence.keys)
+	weighted_conflict_count: int
+
+	def part_compression(self, part_compression: List[CompressionSequence])->List[MergeMapping]:
+		return [dict(zip(compression.keys, ids)) for compression, ids in zip(part_compression, self.group_ids)]
+
+class Annealer:
+	"""
+	Simulated annealing over both the partition and the grouping of the keys of each part,
+	minimizing the weighted conflict count.
+
+	The weighted conflict count is maintained incrementally: moving one key of one part to another group
+	only touches the words that contain that key.
+	Moving a bit from part i to part j resets the groups of both parts to those of the greedy merges,
+	which is done as a sequence of key moves as well.
+	"""
+
+	def __init__(self, frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence],
+			partition: Partition, random_: random.Random)->None:
+		self.random=random_
+		self.part_compression=part_compression
+		self.max_bits=[max_bits(compression) for compression in part_compression]
+		key_indices=[
+				{key: index for index, key in enumerate(compression.keys)}
+				for compression in part_compression]
+		self.codes: List[Tuple[int, ...]]=[
+				tuple(key_indices[i][part] for i, part in enumerate(parts))
+				for parts in frequency_parts_mapped]
+		self.counts: List[int]=list(frequency_parts_mapped.values())
+		self.words_by_key: List[List[List[int]]]=[[[] for _ in compression.keys] for compression in part_compression]
+		for word, code in enumerate(self.codes):
+			for i, key in enumerate(code):
+				self.words_by_key[i][key].append(word)
+
+		self.bits: List[int]=list(partition)
+		self.group_ids: List[List[int]]=[
+				compression.group_ids(min(len(compression)-1, 2**bits))
+				for compression, bits in zip(part_compression, partition)]
+		self.values: List[Tuple[int, ...]]=[
+				tuple(ids[key] for ids, key in zip(self.group_ids, code))
+				for code in self.codes]
+		self.buckets: Dict[Tuple[int, ...], List[int]]=defaultdict(list)
+		# {value: counts of the words mapped to value}
+		self.cost=0
+		for word, value in enumerate(self.values):
+			self.cost+=self.add(value, self.counts[word])
+
+	def add(self, value: Tuple[int, ...], count: int)->int:
+		"""
+		Return the change in cost.
+		"""
+		bucket=self.buckets[value]
+		if not bucket:
+			bucket.append(count)
+			return 0
+		maximum=max(bucket)
+		bucket.append(count)
+		return min(count, maximum)
+
+	def remove(self, value: Tuple[int, ...], count: int)->int:
+		bucket=self.buckets[value]
+		if len(bucket)==1:
+			del self.buckets[value]
+			return 0
+		bucket.remove(count)
+		return -min(count, max(bucket))
+
+	def move_key(self, i: int, key: int, group: int)->int:
+		"""
+		Move the key-th key of part i to group. Return the change in cost.
+		"""
+		delta=0
+		self.group_ids[i][key]=group
+		for word in self.words_by_key[i][key]:
+			value=self.values[word]
+			count=self.counts[word]
+			delta+=self.remove(value, count)
+			value=value[:i]+(group,)+value[i+1:]
+			self.values[word]=value
+			delta+=self.add(value, count)
+		self.cost+=delta
+		return delta
+
+	def set_group_ids(self, i: int, group_ids: List[int])->None:
+		for key, (old_group, group) in enumerate(zip(self.group_ids[i], group_ids)):
+			if old_group!=group:
+				self.move_key(i, key, group)
+
+	def move_bit(self, i: int, j: int)->None:
+		"""
+		Move a bit from part i to part j, and regroup both parts with the greedy merges.
+		"""
+		self.bits[i]-=1
+		self.bits[j]+=1
+		for k in i, j:
+			compression=self.part_compression[k]
+			self.set_group_ids(k, compression.group_ids(min(len(compression)-1, 2**self.bits[k])))
+
+	def snapshot(self)->System:
+		return System(tuple(self.bits), tuple(map(tuple, self.group_ids)), self.cost)
+
+	def random_move(self, bit_move_probability: float)->Optional[Callable[[], None]]:
+		"""
+		Make a random move. Return a function that undoes it, or None if no move was made.
+		"""
+		parts=[i for i in range(8) if self.max_bits[i]>0]
+		if self.random.random()<bit_move_probability:
+			i, j=self.random.sample(parts, 2)
+			if self.bits[i]==0 or self.bits[j]==self.max_bits[j]:
+				return None
+			old_group_ids=self.group_ids[i][:], self.group_ids[j][:]
+			self.move_bit(i, j)
+			def undo_bit_move()->None:
+				self.bits[i]+=1
+				self.bits[j]-=1
+				self.set_group_ids(i, old_group_ids[0])
+				self.set_group_ids(j, old_group_ids[1])
+			return undo_bit_move
+
+		i=self.random.choice(parts)
+		if self.bits[i]==0:
+			return None
+		key=self.random.randrange(len(self.group_ids[i]))
+		old_group=self.group_ids[i][key]
+		group=self.random.randrange(2**self.bits[i]-1)
+		if group>=old_group:
+			group+=1
+		self.move_key(i, key, group)
+		def undo_key_move()->None:
+			self.move_key(i, key, old_group)
+		return undo_key_move
+
+	def run(self, seconds: float, bit_move_probability: float=0.05)->System:
+		"""
+		Return the best system found in the given amount of time.
+		"""
+		best=self.snapshot()
+
+		# the start temperature is the average cost increase of a random move
+		increases: List[int]=[1]
+		for _ in range(1000):
+			if len(increases)>100:
+				break
+			old_cost=self.cost
+			undo=self.random_move(bit_move_probability)
+			if undo is not None:
+				if self.cost>old_cost:
+					increases.append(self.cost-old_cost)
+				undo()
+		start_temperature=sum(increases)/len(increases)
+		end_temperature=start_temperature/100
+
+		start_time=time.time()
+		iteration=0
+		while True:
+			if iteration%16==0:
+				elapsed=(time.time()-start_time)/seconds
+				if elapsed>=1:
+					return best
+				temperature=start_temperature*(end_temperature/start_temperature)**elapsed
+			iteration+=1
+
+			old_cost=self.cost
+			undo=self.random_move(bit_move_probability)
+			if undo is None:
+				continue
+			delta=self.cost-old_cost
+			if delta<=0 or self.random.random()<exp(-delta/temperature):
+				if self.cost<best.weighted_conflict_count:
+					best=self.snapshot()
+			else:
+				undo()
+				assert self.cost==old_cost
+
+def optimize(frequency_parts_mapped: Dict[Parts, int], part_compression: List[CompressionSequence],
+		start_partitions: List[Partition], seconds: float, seed: Optional[int])->List[System]:
+	"""
+	Run one annealing from each start partition, seconds/len(start_partitions) seconds each.
+	Return the best system found by each run, best first.
+	"""
+	random_=random.Random(seed)
+	result=[
+			Annealer(frequency_parts_mapped, part_compression, partition, random_).run(seconds/len(start_partitions))
+			for partition in start_partitions]
+	result.sort(key=lambda system: system.weighted_conflict_count)
+	return result
+
+hand_written_partitions: List[Partition]=[
 	(5, 0, 4, 3, 5, 0, 4, 1),
 	(5, 0, 4, 0, 5, 5, 0, 3),
 	(5, 0, 4, 1, 5, 0, 4, 3),
@@ -117,58 +608,94 @@ if not args.search_all:
 	(5, 4, 0, 1, 5, 4, 0, 1),
 	(5, 0, 5, 1, 5, 0, 5, 0),
 	(5, 0, 5, 1, 5, 0, 5, 1),
-			]
+		]
 
-for partition_index, partition in enumerate(partitions):
-	cur_part_compression=[part_compression[i][min(len(part_compression[i])-1, 2**partition[i])] for i in range(8)]
-	def remap(parts): return tuple(
-		cur_index_part_compression[part]
-		for part, cur_index_part_compression in zip(parts, cur_part_compression)
-		)
-	distinct_values={remap(parts) for parts, count in frequency_parts_mapped.items()}
-	# disregard frequency for now...
-	conflict_count=len(frequency_parts_mapped)-len(distinct_values)
-	print(
-			partition,
-			partition_index, "/", len(partitions),
-			":",
-			conflict_count,
-			":",
-			datetime.timedelta(
-				seconds=
-				(time.time()-start_time)/(partition_index+1)*len(partitions)
-				)
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Search through two-word brief systems."
 			)
+	parser.add_argument("frequency_file", help="Path to JSON frequency file.")
+	parser.add_argument("output_log_directory", help="Path to temporary log file output directory",
+			nargs="?", default=gettempdir())
+	parser.add_argument("--search-all", "-a", help="Search all possible partitions. "
+			"If this argument is not set, the list of partitions to search in the source code "
+			"should also be modified", action="store_true")
+	parser.add_argument("--jobs", "-j", type=int, default=1,
+			help="Number of worker processes")
+	parser.add_argument("--checkpoint", default=None,
+			help="Path to the checkpoint file. Evaluated partitions are appended to it, "
+			"and are skipped if the search is run again with the same checkpoint file. "
+			"The search refuses to run if the checkpoint was written for another frequency file")
+	parser.add_argument("--optimize", type=float, default=None, metavar="SECONDS",
+			help="Instead of evaluating the partitions with the greedy merges, search for the system "
+			"with the least weighted conflict count, over both the partition and the grouping of each part, "
+			"with simulated annealing for this amount of time")
+	parser.add_argument("--restarts", type=int, default=4,
+			help="With --optimize, number of annealing runs, each starting from one of the best partitions "
+			"with the greedy merges")
+	parser.add_argument("--seed", type=int, default=None,
+			help="Random seed for --optimize")
+	parser.add_argument("--benchmark", action="store_true",
+			help="Compare the speed of the partition evaluators on the selected partitions, then exit")
+	args=parser.parse_args()
+
+	frequency_parts_mapped, old_word, part_frequency=load_frequency(args.frequency_file)
+	part_compression=[CompressionSequence(frequency) for frequency in part_frequency]
+
+	#import readline
+	#import code
+	#code.interact(local=locals())
+
+	if args.search_all:
+		partitions=all_partitions(part_frequency)
+		random.shuffle(partitions)
+	else:
+		partitions=list(dict.fromkeys(hand_written_partitions))
+
+	if args.benchmark:
+		benchmark_evaluators(frequency_parts_mapped, part_compression, partitions)
+		sys.exit()
+
+	if args.optimize is not None:
+		evaluations=make_evaluator(frequency_parts_mapped, part_compression).evaluate(partitions)
+		start_partitions=[
+				partition for partition, evaluation in
+				sorted(zip(partitions, evaluations), key=lambda x: x[1][1])[:args.restarts]]
+		for system in optimize(frequency_parts_mapped, part_compression, start_partitions, args.optimize, args.seed):
+			cur_part_compression=system.part_compression(part_compression)
+			conflict_count=count_conflicts(frequency_parts_mapped, cur_part_compression)
+			print(system.partition, ":", conflict_count, ":", system.weighted_conflict_count)
+			name=f"{''.join(map(str, system.partition))}_{conflict_count}_{system.weighted_conflict_count}"
+			with open(Path(args.output_log_directory)/f"system_{name}.json", "w") as f:
+				json.dump({
+					"partition": system.partition,
+					"groups": [
+						[[key for key, group_id in mapping.items() if group_id==group] for group in sorted(set(mapping.values()))]
+						for mapping in cur_part_compression],
+					"weighted_conflict_count": system.weighted_conflict_count,
+					}, f, ensure_ascii=False)
+			write_log(Path(args.output_log_directory)/f"log_{name}.json",
+					frequency_parts_mapped, old_word, cur_part_compression)
+		sys.exit()
+
+	result=search(partitions, frequency_parts_mapped, part_compression,
+			Path(args.checkpoint) if args.checkpoint is not None else None, args.jobs)
+
+	summary=sorted(result.items(), key=lambda x: x[1])
+	with open(Path(args.output_log_directory)/"summary.tsv", "w") as f:
+		f.write("partition\tconflict_count\tweighted_conflict_count\n")
+		for partition, (conflict_count, weighted_conflict_count) in summary:
+			f.write("".join(map(str, partition))+f"\t{conflict_count}\t{weighted_conflict_count}\n")
+	for partition, (conflict_count, weighted_conflict_count) in summary[:20]:
+		print(partition, ":", conflict_count, ":", weighted_conflict_count)
 
 	if not args.search_all:
-		frequency_list: List[Tuple[Parts, int]]=sorted(
-				frequency_parts_mapped.items(), key=lambda x: x[1], reverse=True)
-		data_: Dict[Parts, List[Tuple[str, int]]]=defaultdict(list)
-		for parts_, count in frequency_list:
-			data_[
-					remap(parts_)
-					].append((
-						old_word[parts_],
-						count))
-		partition_string="".join(map(str, partition))
-		with open(Path(args.output_log_directory)/f"log_{partition_string}_{conflict_count}.json", "w") as f:
-			data_2=[
-					#[word for word, count in words]
-					words
-					for words in 
-					sorted(
-						[words for words in data_.values() if len(words)!=1]
-						, key=lambda words: words[1][1], reverse=True)
-					]
-
-			f.write("[\n")
-			for index, item in enumerate(data_2):
-				if index!=0:
-					f.write(",\n")
-				json.dump(
-						item,
-						f,
-						ensure_ascii=False,
-						#indent=0
-						)
-			f.write("\n]")
+		for partition in partitions:
+			partition_string="".join(map(str, partition))
+			write_log(Path(args.output_log_directory)/f"log_{partition_string}_{result[partition][0]}.json",
+					frequency_parts_mapped, old_word,
+					partition_compression(part_compression, partition))
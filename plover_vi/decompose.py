@@ -1,5 +1,19 @@
+"""
+Map each syllable to its parts.
+
+The table is built by enumerating every combination through construct, which is slow,
+so it's loaded lazily on first access of `decompose` and cached at
+plover_vi.config.decompose_cache_path. The cache is rebuilt when the inventories or rules
+in library change.
+"""
+import hashlib
+import marshal
+import sys
+import zlib
+from typing import NamedTuple, Dict
+
+from . import library
 from .library import construct, onsets, nucleuses, codas, tones
-from typing import NamedTuple, Dict, List
 
 class SyllableParts(NamedTuple):
 	onset: str
@@ -8,13 +22,69 @@ class SyllableParts(NamedTuple):
 	tone: str
 	new_tone_placement: bool
 
-decompose: Dict[str, SyllableParts]={}
+decompose: Dict[str, SyllableParts]
+
+def build()->Dict[str, SyllableParts]:
+	result: Dict[str, SyllableParts]={}
+	for new_tone_placement in (False, True): # prefer (True) to (False)
+		for onset in onsets:
+			for nucleus in nucleuses:
+				for coda in codas:
+					for tone in tones:
+						word=construct(onset, nucleus, coda, tone, new_tone_placement)
+						if word is not None:
+							result[word]=SyllableParts(onset, nucleus, coda, tone, new_tone_placement)
+	return result
+
+def library_hash()->str:
+	"""
+	Hash of everything in library that the result of build() depends on.
+	"""
+	h=hashlib.sha256(sys.version.encode('u8'))
+	h.update(repr((onsets, nucleuses, codas, tones, sorted(library.add_tone_table.items()))).encode('u8'))
+	h.update(marshal.dumps(construct.__code__))
+	h.update(marshal.dumps(build.__code__))
+	return h.hexdigest()
+
+def read_cache(data: bytes, expected_hash: str)->Dict[str, SyllableParts]:
+	"""
+	Raise ValueError if the cache is stale or malformed.
+	"""
+	try:
+		hash_, words, parts=marshal.loads(zlib.decompress(data))
+		if hash_!=expected_hash:
+			raise ValueError("Stale cache")
+		return dict(zip(words, map(SyllableParts._make, parts)))
+	except (zlib.error, EOFError, TypeError) as e:
+		raise ValueError("Malformed cache") from e
+
+def write_cache(data: Dict[str, SyllableParts], hash_: str)->bytes:
+	return zlib.compress(marshal.dumps((
+		hash_,
+		list(data.keys()),
+		[tuple(parts) for parts in data.values()],
+		)))
+
+def load()->Dict[str, SyllableParts]:
+	from plover_vi import config
+	path=config.decompose_cache_path
+	hash_=library_hash()
+	try:
+		return read_cache(path.read_bytes(), hash_)
+	except (OSError, ValueError):
+		pass
+
+	result=build()
+	try:
+		path.parent.mkdir(parents=True, exist_ok=True)
+		library.write_atomically(path, write_cache(result, hash_))
+	except OSError:
+		pass
+	return result
 
-for new_tone_placement in (False, True): # prefer (True) to (False)
-	for onset in onsets:
-		for nucleus in nucleuses:
-			for coda in codas:
-				for tone in tones:
-					word=construct(onset, nucleus, coda, tone, new_tone_placement)
-					if word is not None:
-						decompose[word]=SyllableParts(onset, nucleus, coda, tone, new_tone_placement)
+def __getattr__(name: str):
+	if name=="decompose":
+		global decompose
+		decompose=load()
+		return decompose
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
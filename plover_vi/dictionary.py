@@ -1,13 +1,19 @@
 #!/bin/python
-from typing import List, Dict, Optional, Union, Iterable
+from typing import List, Dict, Optional, Union, Iterable, Set, Tuple, Callable
 from pathlib import Path
+from collections import defaultdict
 import json
+import marshal
+import threading
+import time
+import zlib
 
-from plover import system, config  # type: ignore
+from plover import system, log  # type: ignore
 
 import plover_vi.config
-from plover_vi import library
-from plover_vi.stroke import Stroke, decompose, remap, subsets
+from plover_vi import library, instrumentation, compiled_brief
+from plover_vi.stroke import Stroke, decompose, remap, subsets, steno_to_int
+from plover_vi.compiled_brief import BriefIndex, slot_runs, to_slot
 
 LONGEST_KEY=2
 
@@ -29,6 +35,13 @@ right_disambiguation_index: Dict[Stroke, int]={
         Stroke("-TS"): 3,
         }
 
+# integer versions of the above, for lookup (which doesn't create any Stroke)
+vowel_bits                    : int=int(vowel_mask)
+star_bits                     : int=int(star_mask)
+right_disambiguation_bits     : int=int(right_disambiguation_mask)
+right_disambiguation_index_int: Dict[int, int]={
+		int(stroke): index for stroke, index in right_disambiguation_index.items()}
+
 left_to_right_mirror: Dict[str, str]={
 		'T-': '-L',
 		'K-': '-G',
@@ -142,104 +155,459 @@ del right_to_onset_common_coda_part
 del left_to_consonant_onset_only
 
 
-for left, consonant in left_to_consonant.items():
-	assert left in left_mask, left
-	assert consonant in library.onsets, consonant
-
-for right, consonant in right_to_consonant.items():
-	assert right in right_mask, right
-	assert consonant in library.onsets, consonant
-
-for right, tone in right_to_tone.items():
-	assert right in right_tone_mask, right
-	assert tone in library.tones, tone
-
-for stroke, vowel_glide in vowel_glide_to_stroke.items():
-	assert stroke in vowel_glide_mask
-	assert vowel_glide in library.nucleuses, vowel_glide
+def check_tables()->None:
+	"""
+	Check the tables above against the masks and the inventories of library.
+	Not done at import time, to keep the plugin loading fast, but whenever the simple syllable table is built
+	(the cache is keyed by a hash of the tables, so this is done again whenever they change).
+	"""
+	for left, consonant in left_to_consonant.items():
+		assert left in left_mask, left
+		assert consonant in library.onsets, consonant
+
+	for right, consonant in right_to_consonant.items():
+		assert right in right_mask, right
+		assert consonant in library.onsets, consonant
+
+	for right, tone in right_to_tone.items():
+		assert right in right_tone_mask, right
+		assert tone in library.tones, tone
+
+	for stroke, vowel_glide in vowel_glide_to_stroke.items():
+		assert stroke in vowel_glide_mask
+		assert vowel_glide in library.nucleuses, vowel_glide
+
+def construct_simple(stroke: Stroke)->Optional[str]:
+	"""
+	Construct the word typed by a simple (single-syllable) stroke, bypassing simple_syllable_table.
+	"""
+	#might raise KeyError
+	left_part, vowel_glide, right_coda, right_tone, rest=decompose(
+			stroke, left_mask, vowel_glide_mask, right_coda_mask, right_tone_mask)
+	if rest: return None
+
+	return library.construct(
+			left_to_consonant[left_part],
+			vowel_glide_to_stroke[vowel_glide],
+			right_to_coda[right_coda],
+			right_to_tone[right_tone],
+			new_tone_placement=True, tolerant=True)
+
+simple_syllable_table: Optional[Dict[int, str]]=None
+# {int(stroke): word} for every valid simple stroke, built on first use
+# (by lookup only if plover_vi.config.use_simple_syllable_table is set)
+
+def get_simple_syllable_table()->Dict[int, str]:
+	global simple_syllable_table
+	if simple_syllable_table is None:
+		simple_syllable_table=load_simple_syllable_table()
+	return simple_syllable_table
+
+def simple_syllable_table_hash()->str:
+	"""
+	Hash of everything the result of build_simple_syllable_table() depends on.
+	"""
+	import hashlib  # imported here as it takes a few milliseconds, to keep the plugin loading fast
+	from plover_vi.decompose import library_hash
+	h=hashlib.sha256(library_hash().encode('u8'))
+	h.update(repr([
+		sorted((int(stroke), item) for stroke, item in table.items())
+		for table in (left_to_consonant, vowel_glide_to_stroke, right_to_coda, right_to_tone)
+		]).encode('u8'))
+	h.update(marshal.dumps(build_simple_syllable_table.__code__))
+	return h.hexdigest()
+
+def load_simple_syllable_table()->Dict[int, str]:
+	"""
+	Load the table from plover_vi.config.simple_syllable_table_cache_path,
+	or check the tables and build it (which takes a while) and write it there if the cache is missing or stale.
+	"""
+	path=plover_vi.config.simple_syllable_table_cache_path
+	hash_=simple_syllable_table_hash()
+	try:
+		cached_hash, table=marshal.loads(zlib.decompress(path.read_bytes()))
+		if cached_hash==hash_ and isinstance(table, dict):
+			return table
+	except (OSError, zlib.error, EOFError, ValueError, TypeError):
+		pass
+
+	check_tables()
+	table=build_simple_syllable_table()
+	try:
+		path.parent.mkdir(parents=True, exist_ok=True)
+		library.write_atomically(path, zlib.compress(marshal.dumps((hash_, table))))
+	except OSError:
+		pass
+	return table
+
+def build_simple_syllable_table()->Dict[int, str]:
+	result: Dict[int, str]={}
+	for left_part, onset in left_to_consonant.items():
+		for vowel_glide, nucleus in vowel_glide_to_stroke.items():
+			for right_coda, coda in right_to_coda.items():
+				for right_tone, tone in right_to_tone.items():
+					word=library.construct(onset, nucleus, coda, tone,
+							new_tone_placement=True, tolerant=True)
+					if word is not None:
+						result[int(left_part|vowel_glide|right_coda|right_tone)]=word
+	return result
+
+def check_simple_syllable_table(table: Dict[int, str])->None:
+	"""
+	Check that table agrees with construct_simple on every stroke that takes the simple word branch.
+	"""
+	mask=int(left_mask|vowel_glide_mask|right_coda_mask|right_tone_mask)
+	submask=mask
+	while submask:
+		stroke=Stroke.from_integer(submask)
+		if stroke&vowel_mask:
+			try:
+				word=construct_simple(stroke)
+			except KeyError:
+				word=None
+			assert table.get(submask)==word, (stroke, table.get(submask), word)
+		submask=(submask-1)&mask
+
+brief_slot_mask: Stroke=left_mask|vowel_glide_mask|right_mask
+brief_bits: int=int(brief_slot_mask|star_mask|right_disambiguation_mask)
+# a brief stroke has no other keys
+
+def invert(mapping: Dict[Stroke, str])->Dict[str, List[int]]:
+	result: Dict[str, List[int]]=defaultdict(list)
+	for stroke, item in mapping.items():
+		result[item].append(int(stroke))
+	return result
+
+def brief_index_from_mapping(mapping: library.TwoWordBriefMapping)->BriefIndex:
+	"""
+	Convert the JSON source format {"onset1 nucleus1 onset2": words} to the stroke-keyed index.
+	"""
+	runs=slot_runs(int(brief_slot_mask))
+	consonant_to_left=invert(left_to_consonant)
+	nucleus_to_vowel_glide=invert(vowel_glide_to_stroke)
+	consonant_to_right=invert(right_to_consonant)
+	slots: Dict[int, List[str]]={}
+	for key, words in mapping.items():
+		if not words:
+			continue
+		onset1, nucleus1, onset2=key.split(' ')
+		for left_part in consonant_to_left.get(onset1, ()):
+			for left_vowel_glide in nucleus_to_vowel_glide.get(nucleus1, ()):
+				for right_part in consonant_to_right.get(onset2, ()):
+					slots[to_slot(left_part|left_vowel_glide|right_part, runs)]=words
+	return BriefIndex(int(brief_slot_mask), slots)
+
+multi_word_brief_slot_mask: Stroke=left_mask|left_w_mask|right_mask
+multi_word_brief_bits: int=int(multi_word_brief_slot_mask|star_mask|right_disambiguation_mask)
+# a multi-word brief stroke has no vowel and no other keys
+
+multi_word_brief_length: Dict[Stroke, str]={
+		Stroke(""): '3',
+		Stroke("S"): '4+',
+		}
 
-two_word_brief: library.TwoWordBriefMapping
-try:
-	two_word_brief=json.loads(
-		plover_vi.config.two_word_brief_default_path.read_text(encoding='u8'))
-except FileNotFoundError:
-	two_word_brief={}
+def multi_word_brief_index_from_mapping(mapping: library.TwoWordBriefMapping)->BriefIndex:
+	"""
+	Convert the JSON source format {"onset1 onset2 length": words} to the stroke-keyed index,
+	where length is a value of multi_word_brief_length.
+	"""
+	runs=slot_runs(int(multi_word_brief_slot_mask))
+	consonant_to_left=invert(left_to_consonant)
+	length_to_stroke=invert(multi_word_brief_length)
+	consonant_to_right=invert(right_to_consonant)
+	slots: Dict[int, List[str]]={}
+	for key, words in mapping.items():
+		if not words:
+			continue
+		onset1, onset2, length=key.split(' ')
+		for left_part in consonant_to_left.get(onset1, ()):
+			for length_part in length_to_stroke.get(length, ()):
+				for right_part in consonant_to_right.get(onset2, ()):
+					if left_part|length_part|right_part:
+						# the star stroke alone is left for undo
+						slots[to_slot(left_part|length_part|right_part, runs)]=words
+	return BriefIndex(int(multi_word_brief_slot_mask), slots)
+
+FileSignature=Optional[Tuple[int, int, int]]
+# (inode, mtime, size), or None if the file doesn't exist
+
+def file_signature(path: Path)->FileSignature:
+	try:
+		stat=path.stat()
+	except OSError:
+		return None
+	return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+class BriefFile:
+	"""
+	A brief file, in the JSON source format and/or the compiled format,
+	loaded on first use by get(), then reloaded on a background thread when it changes.
+
+	The paths are read from plover_vi.config (by attribute name) when the file is loaded.
+	"""
+
+	def __init__(self, name: str, json_path_name: str, compiled_path_name: str,
+			slot_mask: Stroke, from_mapping: Callable[[library.TwoWordBriefMapping], BriefIndex])->None:
+		self.name: str=name
+		self.json_path_name: str=json_path_name
+		self.compiled_path_name: str=compiled_path_name
+		self.slot_mask: int=int(slot_mask)
+		self.from_mapping=from_mapping
+		self.index: Optional[BriefIndex]=None
+		# replaced by watch() when the files change
+		self.lock=threading.Lock()
+
+	def paths(self)->Tuple[Path, Path]:
+		return getattr(plover_vi.config, self.json_path_name), getattr(plover_vi.config, self.compiled_path_name)
+
+	def load(self)->BriefIndex:
+		"""
+		Load the compiled file if it's not older than the JSON file, otherwise the JSON file.
+		"""
+		json_path, compiled_path=self.paths()
+		try:
+			if not json_path.exists() or compiled_path.stat().st_mtime>=json_path.stat().st_mtime:
+				return compiled_brief.load(compiled_path, self.slot_mask)
+		except (OSError, ValueError):
+			pass
+		try:
+			return self.from_mapping(json.loads(json_path.read_text(encoding='u8')))
+		except FileNotFoundError:
+			return self.from_mapping({})
+
+	def signature(self)->Tuple[FileSignature, FileSignature]:
+		json_path, compiled_path=self.paths()
+		return file_signature(json_path), file_signature(compiled_path)
+
+	def watch(self, signature: Tuple[FileSignature, FileSignature], interval: float)->None:
+		"""
+		Poll the files, and reload the index when they change.
+
+		The new index is built on this thread and then swapped in by a single assignment,
+		so lookups keep using the old one in the meantime.
+		If the file can't be loaded (for example it's being written), the old index is kept
+		until the file changes again.
+		"""
+		while True:
+			time.sleep(interval)
+			new_signature=self.signature()
+			if new_signature==signature:
+				continue
+			signature=new_signature
+			try:
+				self.index=self.load()
+			except (OSError, ValueError) as e:
+				log.warning(f"plover_vi: cannot reload {self.name} file: {e}")
+
+	def get(self)->BriefIndex:
+		index=self.index
+		if index is None:
+			with self.lock:
+				if self.index is None:
+					signature=self.signature()
+					# taken before loading, so that changes during the load are not missed
+					self.index=self.load()
+					if plover_vi.config.brief_reload_interval is not None:
+						threading.Thread(
+								target=self.watch,
+								args=(signature, plover_vi.config.brief_reload_interval),
+								name=f"plover_vi {self.name} watcher",
+								daemon=True).start()
+				index=self.index
+		return index
+
+two_word_brief=BriefFile("two-word brief",
+		"two_word_brief_default_path", "two_word_brief_compiled_path",
+		brief_slot_mask, brief_index_from_mapping)
+multi_word_brief=BriefFile("multi-word brief",
+		"multi_word_brief_path", "multi_word_brief_compiled_path",
+		multi_word_brief_slot_mask, multi_word_brief_index_from_mapping)
+
+class SuggestionWindow:
+	"""
+	A plover_textarea window, written to from a background thread.
+
+	show() only records the content to be shown, so it never blocks on the window.
+	If it's called several times before the thread gets to it, only the last content is written,
+	and content identical to what's already shown is not written again.
+	A failed write is retried by the next show(), with the plover_textarea instance looked up again.
+	"""
+
+	def __init__(self, window_name: str)->None:
+		self.window_name: str=window_name
+		self.condition=threading.Condition()
+		self.pending: Optional[str]=None
+		self.shown: Optional[str]=None
+		# what is being written or was last written successfully
+		self.thread: Optional[threading.Thread]=None
+		self.available: bool=True
+		# False if plover_textarea is not installed
+		self.instance=None
+
+	def show(self, content: str)->None:
+		if not self.available:
+			return
+		with self.condition:
+			if content==self.shown:
+				self.pending=None
+				return
+			if content==self.pending:
+				return
+			self.pending=content
+			if self.thread is None:
+				self.thread=threading.Thread(target=self.run, name=f"plover_vi {self.window_name}", daemon=True)
+				self.thread.start()
+			self.condition.notify()
+
+	def get_instance(self):
+		"""
+		Return the plover_textarea extension instance, or None if it's not available (yet).
+		"""
+		if self.instance is None:
+			try:
+				import plover_textarea
+			except ImportError:
+				self.available=False
+				return None
+			try:
+				self.instance=plover_textarea.extension.get_instance()
+			except RuntimeError:
+				return None
+		return self.instance
+
+	def run(self)->None:
+		while True:
+			with self.condition:
+				while self.pending is None:
+					self.condition.wait()
+				content=self.pending
+				self.pending=None
+				self.shown=content
+			try:
+				instance=self.get_instance()
+				if instance is None:
+					raise RuntimeError
+				instance.clear(self.window_name)
+				instance.write(self.window_name, content)
+			except Exception as e:
+				# RuntimeError: the extension is not available (yet, or any more).
+				# Anything else is unexpected, but must not stop the thread either.
+				if not isinstance(e, RuntimeError):
+					log.warning(f"plover_vi: cannot write to {self.window_name}: {e!r}")
+				self.instance=None
+				# the next update gets the instance again
+				with self.condition:
+					self.shown=None
+
+brief_suggestion=SuggestionWindow(":plover_vi_brief_suggestion")
+
+def lookup_brief(brief: BriefIndex, stroke: int, index1: int)->Optional[str]:
+	"""
+	index1: the index given by the disambiguation stroke, or 0.
+	"""
+	words=brief.words(stroke)
+	if not words: return None
+
+	brief_suggestion.show(
+			"".join(f"{index+1}: {word}\n" for index, word in enumerate(words[:4]))+"~~~")
+
+	index2=right_disambiguation_index_int[stroke&right_disambiguation_bits]
+	if index1!=0 and index2!=0: return None
+	index2+=index1
+	if index2>=len(words): return None
+	return words[index2]
 
 def lookup(strokes: List[str])->Optional[str]:
 	#might raise KeyError
 	assert len(strokes) in (1, 2)
-	disambiguation: Optional[Stroke]=None
 	index1: int=0
 	try:
-		stroke: Stroke=Stroke(strokes[0])
+		stroke: int=steno_to_int(strokes[0])
 		if len(strokes)==2:
-			disambiguation=Stroke(strokes[1])
-			if disambiguation not in right_disambiguation_index:
-				return None
-			index1=right_disambiguation_index[disambiguation]
-			assert index1!=0
+			index1=right_disambiguation_index_int.get(steno_to_int(strokes[1]), 0)
+			if index1==0: return None
 	except ValueError:
 		return None
 
 
-	if stroke&vowel_mask:
-		if stroke&star_mask:
+	if stroke&vowel_bits:
+		if stroke&star_bits:
 			# 2-word brief
-			left_part, left_vowel_glide, right_part, star, right_disambiguation, rest=decompose(
-					stroke, left_mask, vowel_glide_mask, right_mask, star_mask, right_disambiguation_mask)
-			if rest: return None
-			assert star==star_mask
-			words: List[str]=two_word_brief[
-					' '.join((
-						left_to_consonant[left_part],
-						vowel_glide_to_stroke[left_vowel_glide],
-						right_to_consonant[right_part],
-					))] #might raise KeyError
-			assert words
-
-			try:
-				import plover_textarea
-				try:
-					instance=plover_textarea.extension.get_instance()
-					window_name=":plover_vi_brief_suggestion"
-					instance.clear(window_name)
-					for index, word in enumerate(words[:4]):
-						instance.write(window_name, f"{index+1}: {word}\n")
-					instance.write(window_name, "~~~")
-				except RuntimeError:
-					pass
-			except ImportError:
-				pass
-
-			index=right_disambiguation_index[right_disambiguation]
-			if index1!=0 and index!=0: return None
-			index+=index1
-			if index>=len(words): return None
-			return words[index]
+			if stroke&~brief_bits: return None
+			return lookup_brief(two_word_brief.get(), stroke, index1)
 		else:
 			# simple word
 			if index1: return None
-			left_part, vowel_glide, right_coda, right_tone, rest=decompose(
-					stroke, left_mask, vowel_glide_mask, right_coda_mask, right_tone_mask)
-			if rest: return None
-
-			return library.construct(
-					left_to_consonant[left_part],
-					vowel_glide_to_stroke[vowel_glide],
-					right_to_coda[right_coda],
-					right_to_tone[right_tone],
-					new_tone_placement=True, tolerant=True)
+			if not plover_vi.config.use_simple_syllable_table:
+				return construct_simple(Stroke.from_integer(stroke))
+			return get_simple_syllable_table().get(stroke)
 	else:
-		if index1: return None
-		if stroke&star_mask:
-			# 1 or >=3-word brief
-			# TODO unimplemented
-			return None
+		if stroke&star_bits:
+			# >=3-word brief (1-word briefs are not implemented)
+			if stroke&~multi_word_brief_bits: return None
+			return lookup_brief(multi_word_brief.get(), stroke, index1)
 		else:
 			# 2-character acronym (uppercase)
 			# TODO unimplemented
 			return None
 
-#def reverse_lookup(text: str):
-#	from plover_vi import decompose # this import may be time-consuming, make it lazy
-#	if decompose(text)
+def lookup_branch(strokes: List[str])->str:
+	"""
+	Return the name of the branch of lookup that handles strokes, for instrumentation.
+	"rejected" is for strokes that lookup rejects before looking them up in any table:
+	a second stroke that is not a disambiguation stroke, a second stroke after a simple stroke,
+	or a brief stroke with keys that briefs don't use.
+	"""
+	try:
+		stroke: int=steno_to_int(strokes[0])
+		index1: int=0
+		if len(strokes)==2:
+			index1=right_disambiguation_index_int.get(steno_to_int(strokes[1]), 0)
+			if index1==0: return "rejected"
+	except ValueError:
+		return "invalid"
+	if stroke&vowel_bits:
+		if stroke&star_bits:
+			return "rejected" if stroke&~brief_bits else "brief"
+		return "rejected" if index1 else "simple"
+	if stroke&star_bits:
+		return "rejected" if stroke&~multi_word_brief_bits else "multi_word_brief"
+	return "acronym"
+
+lookup=instrumentation.instrument_lookup(lookup, lookup_branch)
+# a no-op unless enabled, see plover_vi.instrumentation
+
+ReverseIndex=Dict[str, Set[Tuple[str, ...]]]
+
+reverse_index: Optional[Tuple[BriefIndex, BriefIndex, ReverseIndex]]=None
+# built on first use, together with the brief indices it's built from
+
+def build_reverse_index(two_word_brief: BriefIndex, multi_word_brief: BriefIndex)->ReverseIndex:
+	result: ReverseIndex=defaultdict(set)
+
+	for stroke, word in get_simple_syllable_table().items():
+		result[word].add((str(Stroke.from_integer(stroke)),))
+
+	index_to_disambiguation={index: stroke for stroke, index in right_disambiguation_index.items()}
+	for brief in two_word_brief, multi_word_brief:
+		for stroke_bits, words in brief.items():
+			stroke=Stroke.from_integer(stroke_bits)|star_mask
+			for index, word in enumerate(words[:len(index_to_disambiguation)]):
+				disambiguation=index_to_disambiguation[index]
+				result[word].add((str(stroke|disambiguation),))
+				if disambiguation:
+					result[word].add((str(stroke), str(disambiguation)))
+
+	return dict(result)
+
+def reverse_lookup(text: str)->Set[Tuple[str, ...]]:
+	global reverse_index
+	briefs=two_word_brief.get(), multi_word_brief.get()
+	index=reverse_index
+	if index is None or index[0] is not briefs[0] or index[1] is not briefs[1]:
+		index=reverse_index=(*briefs, build_reverse_index(*briefs))
+	return index[2].get(text, set())
+
+if __name__=="__main__":
+	check_tables()
+	check_simple_syllable_table(build_simple_syllable_table())
@@ -0,0 +1,124 @@
+#!/bin/python
+"""
+Export the whole system as a static Plover JSON dictionary, which can be loaded without
+plover_python_dictionary (or by other steno engines).
+
+Every entry that dictionary.lookup accepts is enumerated from the tables of dictionary
+(the simple syllable table and the brief files), instead of calling lookup on every possible stroke.
+The output is written while it's enumerated, so the whole dictionary is never built in memory.
+"""
+import json
+import sys
+import time
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+from plover_vi import dictionary
+from plover_vi.compiled_brief import BriefIndex
+from plover_vi.stroke import Stroke
+
+Entry=Tuple[str, str]
+# (strokes joined by "/", translation)
+
+def brief_entries(brief: BriefIndex)->Iterator[Entry]:
+	"""
+	Yield the entries of brief, both with the disambiguation keys in the brief stroke
+	and in a separate stroke (which lookup only accepts if the brief stroke has none).
+	"""
+	index_to_disambiguation: List[Optional[str]]=[None]*len(dictionary.right_disambiguation_index)
+	for stroke, index in dictionary.right_disambiguation_index.items():
+		index_to_disambiguation[index]=str(stroke)
+	for stroke_bits, words in brief.items():
+		stroke=Stroke.from_integer(stroke_bits)|dictionary.star_mask
+		steno=str(stroke)
+		for index, word in enumerate(words[:len(index_to_disambiguation)]):
+			if index==0:
+				yield steno, word
+			else:
+				yield str(stroke|Stroke(index_to_disambiguation[index])), word
+				yield f"{steno}/{index_to_disambiguation[index]}", word
+
+def entries()->Iterator[Entry]:
+	"""
+	Yield every entry of the system (acronyms are not implemented, so there are none).
+	Each stroke sequence is yielded at most once.
+	"""
+	for stroke, word in dictionary.get_simple_syllable_table().items():
+		yield str(Stroke.from_integer(stroke)), word
+	yield from brief_entries(dictionary.two_word_brief.get())
+	yield from brief_entries(dictionary.multi_word_brief.get())
+
+def write(file: TextIO, entries: Iterator[Entry])->int:
+	"""
+	Write entries to file as a Plover JSON dictionary, one entry per line. Return the number of entries.
+	"""
+	count=0
+	file.write("{")
+	for steno, translation in entries:
+		file.write(",\n" if count else "\n")
+		file.write(json.dumps(steno, ensure_ascii=False))
+		file.write(": ")
+		file.write(json.dumps(translation, ensure_ascii=False))
+		count+=1
+	file.write("\n}\n")
+	return count
+
+def check(entries: Iterator[Entry])->int:
+	"""
+	Check that lookup gives the translation of each entry, and that no stroke sequence is repeated.
+	Return the number of entries.
+	"""
+	dictionary.brief_suggestion.available=False
+	# don't show every brief in the suggestion window
+	seen=set()
+	for steno, translation in entries:
+		assert steno not in seen, steno
+		seen.add(steno)
+		result=dictionary.lookup(steno.split("/"))
+		assert result==translation, (steno, result, translation)
+	return len(seen)
+
+def check_complete(entries: Iterator[Entry])->int:
+	"""
+	Check that lookup rejects every single stroke that is not an entry and only has keys
+	of dictionary.brief_bits|multi_word_brief_bits (which has all the keys any branch of lookup accepts).
+	Return the number of strokes checked. Slow, as there are about a million such strokes.
+	"""
+	dictionary.brief_suggestion.available=False
+	exported={steno for steno, translation in entries}
+	mask=dictionary.brief_bits|dictionary.multi_word_brief_bits
+	count=0
+	submask=mask
+	while True:
+		steno=str(Stroke.from_integer(submask))
+		if steno not in exported:
+			assert dictionary.lookup([steno]) is None, steno
+		count+=1
+		if not submask:
+			return count
+		submask=(submask-1)&mask
+
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Export the plover_vi system as a static Plover JSON dictionary (to stdout)."
+			)
+	parser.add_argument("--check", action="store_true",
+			help="Instead of writing the dictionary, check that lookup gives the same translation for every entry")
+	parser.add_argument("--check-complete", action="store_true",
+			help="With --check, also check that lookup rejects every other single stroke "
+			"that only has keys used by the system (slow)")
+	args=parser.parse_args()
+
+	start_time=time.perf_counter()
+	if args.check:
+		count=check(entries())
+		if args.check_complete:
+			checked=check_complete(entries())
+			print(f"checked {checked} single strokes", file=sys.stderr)
+	else:
+		count=write(sys.stdout, entries())
+	elapsed=time.perf_counter()-start_time
+	print(f"{count} entries in {elapsed:.3f} s ({count/elapsed:.0f} entries/s)", file=sys.stderr)
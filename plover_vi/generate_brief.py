@@ -2,9 +2,10 @@
 """Generate two-word brief mappings."""
 import sys
 import json
+import heapq
 from collections import defaultdict, Counter
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Set, Iterable, Iterator, TextIO, Callable
 
 from plover_vi import config
 from plover_vi.stroke import Stroke
@@ -12,30 +13,60 @@ from plover_vi.decompose import decompose
 from plover_vi.library import TwoWordBriefMapping
 
 
-def generate(frequency: Dict[str, int])->Dict[str, str]:
+def brief_key(word: str)->Optional[str]:
+	"""
+	Return the key "onset1 nucleus1 onset2" of the brief of word, or None if word can't have a brief.
+	"""
+	try:
+		parts=[decompose[syllable.lower()] for syllable in word.split()]
+	except KeyError:
+		return None
+
+	if len(parts)!=2: return None
+	# see multi_word_brief_key for >=3 words
+
+	if any(not part.new_tone_placement for part in parts):
+		return None
+
+	return " ".join((
+		parts[0].onset,
+		parts[0].nucleus,
+		parts[1].onset,
+		))
+
+
+def multi_word_brief_key(word: str)->Optional[str]:
+	"""
+	Return the key "onset1 onset2 length" of the brief of a phrase of 3 or more words,
+	where length is "3" or "4+", or None if word can't have such a brief.
+	"""
+	try:
+		parts=[decompose[syllable.lower()] for syllable in word.split()]
+	except KeyError:
+		return None
+
+	if len(parts)<3: return None
+
+	if any(not part.new_tone_placement for part in parts):
+		return None
+
+	return " ".join((
+		parts[0].onset,
+		parts[1].onset,
+		"3" if len(parts)==3 else "4+",
+		))
+
+
+def generate(frequency: Dict[str, int], key_function: Callable[[str], Optional[str]]=brief_key)->Dict[str, List[str]]:
 	#data: Tuple[Dict[..., str], ...]=({}, {}) # [new_tone_placement] = {...: word}
 	data: TwoWordBriefMapping=defaultdict(list) # {(onset1, nucleus1, onset2): words}
 
 	frequency_list: List[Tuple[str, int]]=sorted(frequency.items(), key=lambda x: x[1], reverse=True)
 
 	for word, count in frequency_list:
-		try:
-			parts=[decompose[syllable.lower()] for syllable in word.split()]
-		except KeyError:
-			continue
-
-		if len(parts)!=2: continue
-		#currently briefs with !=2 words are not supported
-
-		if any(not part.new_tone_placement for part in parts):
-			continue
-
-		data[
-				" ".join((
-					parts[0].onset,
-					parts[0].nucleus,
-					parts[1].onset,
-					))].append(word)
+		key=key_function(word)
+		if key is not None:
+			data[key].append(word)
 
 	for key, l in data.items():
 		for i, word in enumerate(l):
@@ -48,18 +79,169 @@ def generate(frequency: Dict[str, int])->Dict[str, str]:
 	# for some reasons .items() is not recognizable as an iterable
 
 
+reachable_words_per_key: int=4
+# the dictionary can only reach this many words per key, with the -S/-T/-TS disambiguation
+
+
+class BoundedWords:
+	"""
+	The limit most frequent words added so far, with the words that have uppercase letters
+	dropped if their lowercase form is also added.
+
+	limit+slack candidates are kept, and a word that doesn't fit is forgotten.
+	So when kept words with uppercase letters are dropped later (because their lowercase form comes),
+	the words that should take their place may be gone. Only words more frequent than every forgotten word
+	are kept (see lost), so the kept words are always the most frequent ones, but there may be fewer than limit.
+	"""
+	__slots__=("limit", "capacity", "heap", "words", "uppercase", "lost")
+
+	def __init__(self, limit: int, slack: int=0)->None:
+		self.limit: int=limit
+		self.capacity: int=limit+slack
+		self.heap: List[Tuple[int, int, str]]=[]
+		# min-heap of (count, -order, word): the first one is the least frequent, and the latest among ties
+		self.words: Set[str]=set()
+		self.uppercase: Dict[str, int]={}
+		# {lowercase form: number of kept words with uppercase letters that have it}
+		self.lost: Optional[Tuple[int, int, str]]=None
+		# the greatest item forgotten because it didn't fit, if any
+
+	def forget(self, item: Tuple[int, int, str])->None:
+		if self.lost is None or item>self.lost:
+			self.lost=item
+
+	def add(self, word: str, count: int, order: int)->None:
+		item=(count, -order, word)
+		if not self.uppercase and len(self.heap)==self.capacity and item<self.heap[0]:
+			self.forget(item)
+			return
+
+		lower=word.lower()
+		if word!=lower:
+			if lower in self.words:
+				return
+		elif lower in self.uppercase:
+			self.heap=[item for item in self.heap if item[2].lower()!=lower]
+			heapq.heapify(self.heap)
+			self.words={item[2] for item in self.heap}
+			del self.uppercase[lower]
+
+		if self.lost is not None and item<self.lost:
+			# a forgotten word is more frequent, so this one can't take the place of a dropped word
+			return
+		if len(self.heap)<self.capacity:
+			heapq.heappush(self.heap, item)
+		elif item>self.heap[0]:
+			evicted=heapq.heapreplace(self.heap, item)
+			self.forget(evicted)
+			self.discard(evicted[2])
+		else:
+			self.forget(item)
+			return
+		self.words.add(word)
+		if word!=lower:
+			self.uppercase[lower]=self.uppercase.get(lower, 0)+1
+
+	def discard(self, word: str)->None:
+		self.words.remove(word)
+		lower=word.lower()
+		if word!=lower:
+			self.uppercase[lower]-=1
+			if not self.uppercase[lower]:
+				del self.uppercase[lower]
+
+	def most_common(self)->List[str]:
+		return [word for count, negative_order, word in heapq.nlargest(self.limit, self.heap)]
+
+
+def generate_stream(frequency: Iterable[Tuple[str, int]], limit: int=reachable_words_per_key,
+		key_function: Callable[[str], Optional[str]]=brief_key, slack: int=3*reachable_words_per_key)->Dict[str, List[str]]:
+	"""
+	Like generate, but read the frequency items in one pass in any order and keep at most limit words per key
+	(and slack more candidates), so the memory usage is proportional to the number of keys.
+
+	Each list of the result is a prefix of the list of generate(dict(frequency)) truncated to limit words.
+	It's shorter if more than slack kept words with uppercase letters are dropped after some word is forgotten
+	(see BoundedWords), and a word with uppercase letters is kept if its lowercase form came before and was forgotten.
+	Both only happen when words with uppercase letters are more frequent than their lowercase forms.
+	Keys with the same number of kept words are in the order they're first seen.
+	"""
+	data: Dict[str, BoundedWords]={}
+	for order, (word, count) in enumerate(frequency):
+		key=key_function(word)
+		if key is None:
+			continue
+		words=data.get(key)
+		if words is None:
+			words=data[key]=BoundedWords(limit, slack)
+		words.add(word, count, order)
+
+	return dict(sorted(
+		((key, words.most_common()) for key, words in data.items()),
+		key=lambda x: len(x[1]), reverse=True))
+
+
+def iterate_frequency(file: TextIO)->Iterator[Tuple[str, int]]:
+	"""
+	Iterate over the items of a frequency file as written by bigram_frequency or ngram_frequency
+	(a JSON object with indent=0, so one item per line), or of several such files concatenated,
+	without loading it whole.
+	Other JSON objects are loaded whole.
+	"""
+	first_line=file.readline()
+	if first_line.strip() not in ("{", "{}"):
+		yield from json.loads(first_line+file.read()).items()
+		return
+	decode=json.JSONDecoder().raw_decode
+	for line in file:
+		if not line.startswith('"'):
+			# start or end of an object
+			continue
+		item, end=decode(line)
+		yield item, int(line[line.index(":", end)+1:].rstrip().rstrip(","))
+
+
 if __name__=="__main__":
 	import argparse
 
 	parser=argparse.ArgumentParser(
 			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-			usage="Generate two-word brief file for plover_vi plugin."
+			usage="Generate two-word (or multi-word) brief file for plover_vi plugin."
 			)
+	parser.add_argument("--stream", action="store_true",
+			help="Read the frequency list (from stdin) in one pass and only keep the most frequent words of each key, "
+			"see generate_stream")
+	parser.add_argument("--limit", type=int, default=reachable_words_per_key,
+			help="With --stream, number of words to keep per key")
+	parser.add_argument("--slack", type=int, default=3*reachable_words_per_key,
+			help="With --stream, number of additional candidates to keep per key, "
+			"to replace the words with uppercase letters that are dropped when their lowercase form comes later")
+	parser.add_argument("--multi-word", action="store_true",
+			help="Generate the briefs of phrases of 3 or more words instead "
+			f"(the plugin reads them from {config.multi_word_brief_path}). "
+			"The input can be the concatenation of the n-gram frequency lists of ngram_frequency for n>=3; "
+			"--stream is recommended, as there are many more such phrases")
+	parser.add_argument("--compiled", default=None, metavar="PATH",
+			help="Also write the brief file in the compiled format to this path "
+			f"(the plugin reads it from {config.two_word_brief_compiled_path}, "
+			f"or {config.multi_word_brief_compiled_path} with --multi-word)")
 	args=parser.parse_args()
 
-	json.dump(
+	key_function=multi_word_brief_key if args.multi_word else brief_key
+	result=(
+			generate_stream(iterate_frequency(sys.stdin), args.limit, key_function, args.slack)
+			if args.stream else
 			generate(
 				json.load(sys.stdin),
-				),
+				key_function,
+				))
+	json.dump(
+			result,
 			sys.stdout,
 			ensure_ascii=False, indent=0)
+
+	if args.compiled is not None:
+		from plover_vi import compiled_brief
+		from plover_vi.dictionary import brief_index_from_mapping, multi_word_brief_index_from_mapping
+		compiled_brief.write(args.compiled,
+				(multi_word_brief_index_from_mapping if args.multi_word else brief_index_from_mapping)(result))
@@ -0,0 +1,85 @@
+"""
+Approximate counting of the most frequent items in a stream with a fixed number of counters.
+
+Uses the Space-Saving algorithm (Metwally, Agrawal, El Abbadi, "Efficient Computation of Frequent
+and Top-k Elements in Data Streams", 2005).
+"""
+import heapq
+from typing import Dict, List, Tuple, Iterable, Union
+
+
+class SpaceSaving:
+	"""
+	Track at most capacity items.
+
+	For each tracked item, the true count is in [count-error, count].
+	Each untracked item has true count at most minimum().
+	"""
+
+	def __init__(self, capacity: int)->None:
+		assert capacity>0
+		self.capacity: int=capacity
+		self.counts: Dict[str, int]={}
+		self.errors: Dict[str, int]={}
+		self.heap: List[Tuple[int, str]]=[]
+		# (count, item) for each tracked item. The count might be outdated (smaller than the actual count)
+
+	def add(self, item: str, count: int=1)->None:
+		counts=self.counts
+		if item in counts:
+			counts[item]+=count
+			return
+		if len(counts)<self.capacity:
+			counts[item]=count
+			self.errors[item]=0
+			heapq.heappush(self.heap, (count, item))
+			return
+
+		heap=self.heap
+		while True:
+			minimum, victim=heap[0]
+			if counts[victim]==minimum:
+				break
+			heapq.heapreplace(heap, (counts[victim], victim))
+		del counts[victim]
+		del self.errors[victim]
+		counts[item]=minimum+count
+		self.errors[item]=minimum
+		heapq.heapreplace(heap, (minimum+count, item))
+
+	def minimum(self)->int:
+		if len(self.counts)<self.capacity:
+			return 0
+		return min(self.counts.values())
+
+	def update(self, items: Union[Iterable[str], "SpaceSaving"])->None:
+		"""
+		Add each item in items, or merge another summary into this one.
+		"""
+		if not isinstance(items, SpaceSaving):
+			add=self.add
+			for item in items:
+				add(item)
+			return
+
+		minimum, other_minimum=self.minimum(), items.minimum()
+		merged: Dict[str, Tuple[int, int]]={}
+		for item in self.counts.keys()|items.counts.keys():
+			merged[item]=(
+					self.counts.get(item, minimum)+items.counts.get(item, other_minimum),
+					self.errors.get(item, minimum)+items.errors.get(item, other_minimum),
+					)
+		kept=sorted(merged.items(), key=lambda x: x[1][0], reverse=True)[:self.capacity]
+		self.counts={item: count for item, (count, error) in kept}
+		self.errors={item: error for item, (count, error) in kept}
+		self.heap=[(count, item) for item, count in self.counts.items()]
+		heapq.heapify(self.heap)
+
+	def most_common(self, k: int)->List[Tuple[str, int, int]]:
+		"""
+		Return the k items with the largest count as (item, count, error), most common first.
+		"""
+		return [
+				(item, count, self.errors[item])
+				for item, count in sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:k]
+				]
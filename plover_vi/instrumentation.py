@@ -0,0 +1,164 @@
+"""
+Opt-in instrumentation of dictionary.lookup.
+
+Enabled by setting the environment variable PLOVER_VI_STATS (or plover_vi.config.lookup_stats_path)
+to the path of the file the statistics are written to, as JSON:
+	{branch: {"calls", "hits", "total_ns", "histogram"}}
+where histogram[i] is the number of calls that took [2**i, 2**(i+1)) ns, with i from 0 to histogram_size-1
+(except the last bucket, which has all the longer calls).
+
+Additionally, PLOVER_VI_PROFILE can be a comma-separated list of:
+	cprofile: profile the lookups, written to <path>.prof (read with pstats)
+	tracemalloc: trace memory allocations, the top allocation sites are written to <path>.tracemalloc.txt
+
+The statistics are written when Plover exits, when the file <path>.request is created
+(it's deleted after the statistics are written), and on SIGUSR1 where available
+(within request_poll_interval, by the same background thread).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from plover_vi import library
+
+histogram_size: int=40
+request_poll_interval: float=1.
+
+class BranchStats:
+	__slots__=("calls", "hits", "total_ns", "histogram")
+
+	def __init__(self)->None:
+		self.calls: int=0
+		self.hits: int=0
+		self.total_ns: int=0
+		self.histogram: List[int]=[0]*histogram_size
+
+	def record(self, hit: bool, ns: int)->None:
+		self.calls+=1
+		self.hits+=hit
+		self.total_ns+=ns
+		self.histogram[min(ns.bit_length()-1, histogram_size-1) if ns else 0]+=1
+
+	def to_json(self)->Dict[str, object]:
+		return {
+				"calls": self.calls,
+				"hits": self.hits,
+				"total_ns": self.total_ns,
+				"histogram": self.histogram,
+				}
+
+def stats_path()->Optional[Path]:
+	path=os.environ.get("PLOVER_VI_STATS")
+	if path:
+		return Path(path)
+	from plover_vi import config
+	return config.lookup_stats_path
+
+def profile_options()->List[str]:
+	return [option.strip() for option in os.environ.get("PLOVER_VI_PROFILE", "").split(",") if option.strip()]
+
+Lookup=TypeVar("Lookup", bound=Callable)
+
+class LookupStats:
+	def __init__(self, path: Path, profile: List[str])->None:
+		unknown=set(profile)-{"cprofile", "tracemalloc"}
+		if unknown:
+			raise ValueError(f"Unknown PLOVER_VI_PROFILE options: {sorted(unknown)}")
+		self.path: Path=path
+		self.branches: Dict[str, BranchStats]={}
+		self.lock=threading.Lock()
+		self.dump_requested: bool=False
+		# set by the signal handler, which can't dump by itself: it runs on the main thread,
+		# possibly in the middle of a lookup that holds the lock
+
+		self.profiler=None
+		if "cprofile" in profile:
+			import cProfile
+			self.profiler=cProfile.Profile()
+		self.tracemalloc: bool="tracemalloc" in profile
+		if self.tracemalloc:
+			import tracemalloc
+			tracemalloc.start()
+
+	def instrument(self, lookup: Lookup, branch: Callable[[List[str]], str])->Lookup:
+		"""
+		Return a wrapper of lookup that records the statistics of each call, under the branch
+		(as returned by branch(strokes)) of lookup that handles strokes.
+		Raising KeyError counts as a miss.
+		"""
+		profiler=self.profiler
+		def instrumented_lookup(strokes: List[str]):
+			hit=False
+			start=time.perf_counter_ns()
+			try:
+				if profiler is None:
+					result=lookup(strokes)
+				else:
+					result=profiler.runcall(lookup, strokes)
+				hit=result is not None
+				return result
+			finally:
+				ns=time.perf_counter_ns()-start
+				name=branch(strokes)
+				with self.lock:
+					stats=self.branches.get(name)
+					if stats is None:
+						stats=self.branches[name]=BranchStats()
+					stats.record(hit, ns)
+		return instrumented_lookup  # type: ignore
+
+	def dump(self)->None:
+		with self.lock:
+			data={name: stats.to_json() for name, stats in sorted(self.branches.items())}
+			if self.profiler is not None:
+				self.profiler.dump_stats(str(self.path)+".prof")
+		library.write_atomically(self.path, json.dumps(data, indent=1).encode("u8"))
+
+		if self.tracemalloc:
+			import tracemalloc
+			snapshot=tracemalloc.take_snapshot()
+			Path(str(self.path)+".tracemalloc.txt").write_text(
+					"\n".join(str(statistic) for statistic in snapshot.statistics("lineno")[:50]))
+
+	def watch_requests(self)->None:
+		request_path=Path(str(self.path)+".request")
+		while True:
+			time.sleep(request_poll_interval)
+			if self.dump_requested:
+				self.dump_requested=False
+				self.dump()
+			if request_path.exists():
+				self.dump()
+				try:
+					request_path.unlink()
+				except OSError:
+					pass
+
+	def install_triggers(self)->None:
+		atexit.register(self.dump)
+		threading.Thread(target=self.watch_requests, name="plover_vi stats request watcher", daemon=True).start()
+		try:
+			import signal
+			signal.signal(signal.SIGUSR1, lambda signal_number, frame: setattr(self, "dump_requested", True))
+		except (ImportError, AttributeError, ValueError):
+			# not available on this platform, or not in the main thread
+			pass
+
+lookup_stats: Optional[LookupStats]=None
+
+def instrument_lookup(lookup: Lookup, branch: Callable[[List[str]], str])->Lookup:
+	"""
+	Return lookup itself if the instrumentation is not enabled, otherwise an instrumented wrapper of it.
+	"""
+	global lookup_stats
+	path=stats_path()
+	if path is None:
+		return lookup
+	if lookup_stats is None:
+		lookup_stats=LookupStats(path, profile_options())
+		lookup_stats.install_triggers()
+	return lookup_stats.instrument(lookup, branch)
@@ -2,26 +2,70 @@ LONGEST_KEY = 1
 
 
 import unicodedata, codecs, sys, re, itertools, json, os
-from typing import List, Optional, MutableMapping, Tuple
+from typing import List, Dict, Optional, MutableMapping, Tuple, Union
+
+
+def write_atomically(path: Union[str, "os.PathLike[str]"], data: bytes)->None:
+	"""
+	Write data to a temporary file next to path, then rename it to path,
+	so that a reader (possibly another process) never sees a partially written file.
+	"""
+	temporary_path=f"{os.fspath(path)}.{os.getpid()}.tmp"
+	try:
+		with open(temporary_path, "wb") as file:
+			file.write(data)
+		os.replace(temporary_path, path)
+	except BaseException:
+		try:
+			os.unlink(temporary_path)
+		except OSError:
+			pass
+		raise
 
 
 diacritics_pattern=re.compile(' (WITH|AND) (GRAVE|HOOK ABOVE|TILDE|ACUTE|DOT BELOW)')
 
-def strip_tone(char: str)->str:
+def strip_tone_unicodedata(char: str)->str:
 	return unicodedata.lookup(diacritics_pattern.sub('', unicodedata.name(char)))
 
-def add_tone(char: str,tone: str)->str:
+def add_tone_unicodedata(char: str,tone: str)->str:
 	if tone=='LEVEL':
 		return char
 	name=unicodedata.name(char)
 	return unicodedata.lookup(name+(' AND ' if 'WITH' in name else ' WITH ')+tone)
 
 
+vowels: str='aăâeêioôơuưy'
+vowels+=vowels.upper()
+tones: List[str]=['LEVEL', 'ACUTE', 'GRAVE', 'HOOK ABOVE', 'TILDE', 'DOT BELOW',]
+
+add_tone_table: Dict[Tuple[str, str], str]={
+		(vowel, tone): add_tone_unicodedata(vowel, tone)
+		for vowel in vowels for tone in tones}
+split_tone_table: Dict[str, Tuple[str, str]]={
+		char: vowel_tone for vowel_tone, char in add_tone_table.items()}
+# {toned vowel: (vowel, tone)}, inverse of add_tone_table
+assert len(split_tone_table)==len(add_tone_table)
+for char, (vowel, tone) in split_tone_table.items():
+	assert strip_tone_unicodedata(char)==vowel, char
+
+def strip_tone(char: str)->str:
+	try:
+		return split_tone_table[char][0]
+	except KeyError:
+		return strip_tone_unicodedata(char)
+
+def add_tone(char: str,tone: str)->str:
+	try:
+		return add_tone_table[char, tone]
+	except KeyError:
+		return add_tone_unicodedata(char, tone)
+
+
 onsets: List[str]=['', 'b', 'p', 'tr', 'ch', 's', 'x', 'd', 'gi', 'r', 'l', 'h', 'kh', 'm', 'n', 'đ', 't', 'th', 'ph', 'v', 'q', 'c/k', 'g/gh', 'nh', 'ng/ngh', 'y',]
 nucleuses_without_w: List[str]=['a', '/ă', 'e', 'ê', 'i', 'o', 'ô', 'ơ', 'u', 'ư', '/â', '/oo', 'ia/iê', 'ưa/ươ', 'ua/uô',]
 nucleuses_with_w: List[str]=['oa', '/oă', 'oe', 'uê', 'uy', 'uơ', '/uâ', 'uya/uyê',]
 codas: List[str]=['', 'c', 'ch', 'm', 'n', 'ng', 'nh', 'p', 't', 'o/u', 'i/y',]
-tones: List[str]=['LEVEL', 'ACUTE', 'GRAVE', 'HOOK ABOVE', 'TILDE', 'DOT BELOW',]
 
 
 nucleuses: List[str]=nucleuses_without_w+nucleuses_with_w
@@ -0,0 +1,141 @@
+#!/bin/python
+"""
+Count unigrams, bigrams, trigrams etc. in one pass.
+
+Words are interned to integer IDs, and each n-gram is counted as a single integer
+with the IDs packed id_bits bits apart, so no string is built per n-gram.
+An n-gram is a sequence of n words, each separated from the previous one by whitespace only
+(for n=2 the counts are the same as those of bigram_frequency).
+"""
+import json
+import functools
+import multiprocessing
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Iterable, Iterator, Tuple, TextIO
+
+from plover_vi.bigram_frequency import Task, split_file, read_task_chunks, iterate_words
+
+id_bits: int=32
+id_mask: int=(1<<id_bits)-1
+
+
+class NgramCounter:
+	def __init__(self, max_n: int)->None:
+		self.max_n: int=max_n
+		self.ids: Dict[str, int]={}
+		self.words: List[str]=[]
+		self.counts: List[Counter]=[Counter() for _ in range(max_n)]
+		# counts[n-1]: {packed n-gram: count}
+
+	def intern(self, word: str)->int:
+		id_=self.ids.get(word)
+		if id_ is None:
+			id_=self.ids[word]=len(self.words)
+			self.words.append(word)
+		return id_
+
+	def add_words(self, words: Iterable[Tuple[str, bool]])->None:
+		"""
+		words: as returned by bigram_frequency.iterate_words.
+		"""
+		intern=self.intern
+		counts=self.counts
+		max_n=self.max_n
+		previous: List[int]=[]
+		# previous[n-1]: packed n-gram that ends at the previous word
+		for word, joined in words:
+			id_=intern(word)
+			if not joined:
+				previous=[]
+			current=[id_]
+			for key in previous[:max_n-1]:
+				current.append(key<<id_bits|id_)
+			for n, key in enumerate(current):
+				counts[n][key]+=1
+			previous=current
+
+	def update(self, other: "NgramCounter")->None:
+		"""
+		Add the counts of other (which has its own IDs) to this counter.
+		"""
+		assert other.max_n==self.max_n
+		id_map=[self.intern(word) for word in other.words]
+		for n, (counts, other_counts) in enumerate(zip(self.counts, other.counts)):
+			for key, count in other_counts.items():
+				new_key=0
+				for shift in range(n*id_bits, -1, -id_bits):
+					new_key=new_key<<id_bits|id_map[key>>shift&id_mask]
+				counts[new_key]+=count
+
+	def unpack(self, key: int, n: int)->str:
+		return ' '.join(
+				self.words[key>>shift&id_mask]
+				for shift in range((n-1)*id_bits, -1, -id_bits))
+
+	def most_common(self, n: int)->Iterator[Tuple[str, int]]:
+		for key, count in self.counts[n-1].most_common():
+			yield self.unpack(key, n), count
+
+
+def write_frequency(items: Iterable[Tuple[str, int]], file: TextIO)->None:
+	"""
+	Same output as json.dump(dict(items), file, indent=0, ensure_ascii=False),
+	without building the dict.
+	"""
+	separator="{\n"
+	for item, count in items:
+		file.write(f"{separator}{json.dumps(item, ensure_ascii=False)}: {count}")
+		separator=",\n"
+	file.write("{}" if separator=="{\n" else "\n}")
+
+
+def count_task(task: Task, chunk_size: int, max_n: int)->NgramCounter:
+	result=NgramCounter(max_n)
+	result.add_words(iterate_words(read_task_chunks(task, chunk_size)))
+	return result
+
+def count_tasks(tasks: List[Task], chunk_size: int, jobs: int, max_n: int)->NgramCounter:
+	result=NgramCounter(max_n)
+	if jobs==1:
+		for task in tasks:
+			result.add_words(iterate_words(read_task_chunks(task, chunk_size)))
+		return result
+	with multiprocessing.Pool(jobs) as pool:
+		for counter in pool.imap(functools.partial(count_task, chunk_size=chunk_size, max_n=max_n), tasks):
+			result.update(counter)
+	return result
+
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Count n-grams in the input files, write the frequency list of each n "
+			"to <output directory>/<n>gram.json."
+			)
+	parser.add_argument("output_directory", help="Path to the output directory.")
+	parser.add_argument("files", nargs="*", default=["-"],
+			help="Input files (.bz2 files are decompressed). N-grams spanning two files are not counted. "
+			"'-' means stdin")
+	parser.add_argument("--max-n", "-n", type=int, default=3,
+			help="Count n-grams for n from 1 to this value")
+	parser.add_argument("--chunk-size", type=int, default=1<<16,
+			help="Number of characters (or bytes, for split files) to read at a time")
+	parser.add_argument("--jobs", "-j", type=int, default=1,
+			help="Number of worker processes")
+	parser.add_argument("--split-size", type=int, default=None,
+			help="Split uncompressed input files into byte ranges of approximately this size, "
+			"to be counted in parallel (the counts are the same as without splitting). "
+			"Smaller ranges also reduce the peak memory usage of each worker, "
+			"which is proportional to the number of distinct n-grams in a range")
+	args=parser.parse_intermixed_args()
+
+	tasks: List[Task]=[task for path in args.files for task in split_file(path, args.split_size)]
+	result=count_tasks(tasks, args.chunk_size, args.jobs, args.max_n)
+	output_directory=Path(args.output_directory)
+	output_directory.mkdir(parents=True, exist_ok=True)
+	for n in range(1, args.max_n+1):
+		with open(output_directory/f"{n}gram.json", "w", encoding="u8") as f:
+			write_frequency(result.most_common(n), f)
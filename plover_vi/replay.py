@@ -0,0 +1,225 @@
+#!/bin/python
+"""
+Replay a stroke log through dictionary.lookup offline, to measure its throughput
+or reproduce a slow session, and write the translated text.
+
+The input is either Plover's stroke log (strokes.log, lines like
+"2021-05-01 12:00:00,123 Stroke(KWR : ['K-', 'W-', 'R-'])", other lines are ignored)
+or one steno stroke per line. It's read as a stream.
+
+The strokes are translated like Plover's translator does with this dictionary alone
+(LONGEST_KEY=2), making the same lookups: each stroke is first looked up together with
+the previous translations that fit in LONGEST_KEY strokes, which it replaces on a match, then alone.
+A stroke that doesn't match is output as is, and the undo stroke (if it has no translation)
+removes the last translation and puts back the translations it replaced.
+"""
+import os
+import re
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from plover_vi import dictionary
+from plover_vi.instrumentation import BranchStats
+
+from plover.config import DEFAULT_UNDO_LEVELS  # type: ignore
+
+undo_stroke: str="*"
+undo_length: int=DEFAULT_UNDO_LEVELS
+# number of translations that can be undone (same as Plover), older ones are output
+prefix_steno: str=""
+# steno of the stroke Plover prepends to look up prefix entries (plover.translation.PREFIX_STROKE)
+
+stroke_log_pattern=re.compile(r"Stroke\((\S*) : \[")
+
+def parse_line(line: str)->Optional[str]:
+	"""
+	Return the steno of the stroke in line, or None if there's none.
+	"""
+	match=stroke_log_pattern.search(line)
+	if match is not None:
+		return match[1]
+	if "(" in line:
+		# other lines of Plover's log, such as translations
+		return None
+	return line.strip() or None
+
+def read_strokes(lines: Iterable[str])->Iterator[str]:
+	for line in lines:
+		steno=parse_line(line)
+		if steno is not None:
+			yield steno
+
+class Translation:
+	__slots__=("strokes", "text", "replaced")
+
+	def __init__(self, strokes: List[str], text: Optional[str], replaced: List["Translation"])->None:
+		self.strokes: List[str]=strokes
+		self.text: Optional[str]=text
+		# None if untranslated
+		self.replaced: List[Translation]=replaced
+		# the translations this one replaced, put back when it's undone
+
+	def output(self)->str:
+		return "/".join(self.strokes) if self.text is None else self.text
+
+class Replay:
+	"""
+	Translate the strokes with lookup, recording the time each lookup takes by branch of lookup.
+	"""
+
+	def __init__(self)->None:
+		self.translations: Deque[Translation]=deque()
+		self.branches: Dict[str, BranchStats]={}
+		self.stroke_count: int=0
+		self.lookup_time: int=0
+		# ns
+
+	def lookup(self, strokes: List[str])->Optional[str]:
+		start=time.perf_counter_ns()
+		try:
+			result=dictionary.lookup(strokes)
+		except KeyError:
+			# no translation, as for Plover's dictionary collection
+			result=None
+		ns=time.perf_counter_ns()-start
+		self.lookup_time+=ns
+		name=dictionary.lookup_branch(strokes)
+		stats=self.branches.get(name)
+		if stats is None:
+			stats=self.branches[name]=BranchStats()
+		stats.record(result is not None, ns)
+		return result
+
+	def lookup_with_prefix(self, strokes: List[str])->Optional[str]:
+		"""
+		Same as Plover's Translator._lookup_with_prefix, without formatting (so the previous word is always finished).
+		"""
+		if len(strokes)<dictionary.LONGEST_KEY:
+			text=self.lookup([prefix_steno, *strokes])
+			if text is not None:
+				return text
+		return self.lookup(strokes)
+
+	def find_translation(self, steno: str)->Optional[Translation]:
+		"""
+		Same as Plover's Translator._find_translation_helper.
+		"""
+		count=0
+		stroke_count=1
+		for translation in reversed(self.translations):
+			stroke_count+=len(translation.strokes)
+			if stroke_count>dictionary.LONGEST_KEY:
+				break
+			count+=1
+		translations=[self.translations[index] for index in range(len(self.translations)-count, len(self.translations))]
+		for index in range(len(translations)+1):
+			replaced=translations[index:]
+			strokes=[stroke for translation in replaced for stroke in translation.strokes]+[steno]
+			text=self.lookup_with_prefix(strokes)
+			if text is not None:
+				return Translation(strokes, text, replaced)
+		return None
+
+	def stroke(self, steno: str)->Iterator[str]:
+		"""
+		Translate one more stroke, and yield the text of the translations that can't be undone any more.
+		"""
+		self.stroke_count+=1
+		translations=self.translations
+		text=self.lookup_with_prefix([steno])
+		if text is None and steno==undo_stroke:
+			if translations:
+				translations.extend(translations.pop().replaced)
+			return
+
+		translation=self.find_translation(steno) or Translation([steno], text, [])
+		for _ in translation.replaced:
+			translations.pop()
+		translations.append(translation)
+		while len(translations)>max(undo_length, dictionary.LONGEST_KEY):
+			yield translations.popleft().output()
+
+	def finish(self)->Iterator[str]:
+		while self.translations:
+			yield self.translations.popleft().output()
+
+	def run(self, strokes: Iterable[str], output: TextIO)->None:
+		"""
+		Translate strokes and write the translations to output, separated by spaces.
+		"""
+		first=True
+		def write(texts: Iterable[str])->None:
+			nonlocal first
+			for text in texts:
+				if not first:
+					output.write(" ")
+				output.write(text)
+				first=False
+		for steno in strokes:
+			write(self.stroke(steno))
+		write(self.finish())
+		output.write("\n")
+
+def percentile(stats: BranchStats, fraction: float)->int:
+	"""
+	Return an upper bound (in ns, a power of 2) of the given percentile of the lookup time.
+	"""
+	remaining=stats.calls*fraction
+	for index, count in enumerate(stats.histogram):
+		remaining-=count
+		if remaining<=0:
+			return 1<<(index+1)
+	return 1<<len(stats.histogram)
+
+def report(replay: Replay, elapsed: float)->str:
+	lines=[
+			f"{replay.stroke_count} strokes in {elapsed:.3f} s ({replay.stroke_count/elapsed:.0f} strokes/s), "
+			f"{replay.lookup_time*1e-9:.3f} s in lookup",
+			f"{'branch':<20}{'calls':>10}{'hits':>10}{'mean':>10}{'p50<':>10}{'p99<':>10}  (us)",
+			]
+	for name, stats in sorted(replay.branches.items()):
+		lines.append(f"{name:<20}{stats.calls:>10}{stats.hits:>10}{stats.total_ns/stats.calls/1000:>10.2f}"
+				f"{percentile(stats, 0.5)/1000:>10.2f}{percentile(stats, 0.99)/1000:>10.2f}")
+	return "\n".join(lines)
+
+
+if __name__=="__main__":
+	import argparse
+	import json
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Replay stroke logs through the plover_vi dictionary, "
+			"write the translated text to stdout and the statistics to stderr."
+			)
+	parser.add_argument("logs", nargs="*", metavar="LOG",
+			help="Stroke log files (Plover's strokes.log, or one stroke per line). Default: stdin")
+	parser.add_argument("--no-output", action="store_true",
+			help="Don't write the translated text, only the statistics")
+	parser.add_argument("--stats", default=None, metavar="PATH",
+			help="Also write the statistics as JSON to this file, "
+			"in the same format as plover_vi.instrumentation")
+	args=parser.parse_args()
+
+	dictionary.brief_suggestion.available=False
+	# there's no suggestion window offline
+
+	def lines()->Iterator[str]:
+		if not args.logs:
+			yield from sys.stdin
+		for path in args.logs:
+			with open(path, encoding="u8") as file:
+				yield from file
+
+	replay=Replay()
+	output=open(os.devnull, "w") if args.no_output else sys.stdout
+	start_time=time.perf_counter()
+	replay.run(read_strokes(lines()), output)
+	elapsed=time.perf_counter()-start_time
+	print(report(replay, elapsed), file=sys.stderr)
+
+	if args.stats is not None:
+		with open(args.stats, "w") as file:
+			json.dump({name: stats.to_json() for name, stats in sorted(replay.branches.items())}, file, indent=1)
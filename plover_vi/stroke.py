@@ -1,4 +1,5 @@
-from typing import List, Dict, Iterable, Optional
+import functools
+from typing import List, Dict, Iterable, Optional, Tuple
 
 from plover import system  # type: ignore
 
@@ -36,3 +37,50 @@ def decompose(stroke: Stroke, *parts)->List[Stroke]:
 		combined_before+=part
 	result.append(stroke)
 	return result
+
+StenoTransitions=Dict[Tuple[str, int], Tuple[int, int]]
+# {(character, index of the last key parsed): (index of the key, bits of the key and the number key)}
+
+def build_steno_transitions()->StenoTransitions:
+	"""
+	Precompute the steps of Stroke.from_steno (plover_stroke), which scans the key letters left to right:
+	a letter is the next key with that letter (at an index not smaller than the current one),
+	"-" jumps to the first right-hand key, and a digit is the key of that number plus the number key.
+	"""
+	result: StenoTransitions={}
+	letters: str=Stroke.KEYS_LETTERS
+	first_right_index: int=Stroke.KEY_FIRST_RIGHT_INDEX
+	number_bits: int=Stroke.KEY_TO_MASK[Stroke.NUMBER_KEY] if Stroke.NUMBER_KEY is not None else 0
+	for current in range(len(letters)):
+		if current<first_right_index:
+			result['-', current]=(first_right_index, 0)
+		for letter in set(letters):
+			index=letters.find(letter, current)
+			if index>=0:
+				result[letter, current]=(index, 1<<index)
+		for number, (letter, start) in Stroke.NUMBER_TO_KEY.items():
+			index=letters.find(letter, start)
+			if index>=0:
+				result[number, current]=(index, 1<<index|number_bits)
+	return result
+
+steno_transitions: StenoTransitions=build_steno_transitions()
+
+def parse_steno(steno: str)->int:
+	"""
+	Return int(Stroke(steno)), without creating any Stroke.
+	Raise ValueError if steno is invalid.
+	"""
+	transitions=steno_transitions
+	current=0
+	result=0
+	for letter in steno:
+		step=transitions.get((letter, current))
+		if step is None:
+			raise ValueError(f"invalid letter {letter!r} in {steno!r}")
+		current, bits=step
+		result|=bits
+	return result
+
+steno_to_int=functools.lru_cache(maxsize=1<<14)(parse_steno)
+# same as parse_steno, cached, as the same strokes are looked up again and again
@@ -0,0 +1,224 @@
+#!/bin/python
+"""
+Estimate the number of strokes needed to type a corpus with the current system,
+to compare brief files (for example generated from different frequency lists or brief systems).
+
+Each run of words separated by whitespace only (see bigram_frequency.iterate_words) is split optimally
+into simple strokes (one per syllable) and briefs (one stroke per phrase, including the disambiguation keys,
+for the first len(right_disambiguation_index) words of a brief), by dynamic programming
+over the words, in time proportional to the number of words times the longest brief phrase.
+A word that is not a syllable typeable by a simple stroke (number, foreign word...) is not counted,
+and splits the run.
+
+Capitalization is assumed to be free: syllables are compared case-insensitively,
+and a brief phrase also matches with its first letter capitalized.
+"""
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from plover_vi.bigram_frequency import Task, split_file, read_task_chunks, iterate_words
+from plover_vi.heavy_hitters import SpaceSaving
+
+MissedCounter=TypeVar("MissedCounter", Counter, SpaceSaving)
+
+class System:
+	"""
+	What the cost model needs to know about the system: the syllables with a simple stroke,
+	and {brief phrase: index of the phrase among the words of its brief}.
+	"""
+
+	def __init__(self, syllables: Set[str], briefs: Dict[str, int])->None:
+		self.syllables: Set[str]=syllables
+		self.briefs: Dict[str, int]=briefs
+		self.longest: int=max((phrase.count(" ")+1 for phrase in briefs), default=1)
+
+	@staticmethod
+	def load()->"System":
+		"""
+		Load the current system from plover_vi.dictionary (brief files as configured in plover_vi.config).
+		"""
+		from plover_vi import dictionary
+		briefs: Dict[str, int]={}
+		for brief in dictionary.two_word_brief.get(), dictionary.multi_word_brief.get():
+			for stroke, words in brief.items():
+				for index, word in enumerate(words[:len(dictionary.right_disambiguation_index)]):
+					if briefs.get(word, index)>=index:
+						briefs[word]=index
+		return System(set(dictionary.get_simple_syllable_table().values()), briefs)
+
+	def brief_index(self, phrase: str)->Optional[int]:
+		index=self.briefs.get(phrase)
+		if index is None and phrase[:1].isupper():
+			index=self.briefs.get(phrase[:1].lower()+phrase[1:])
+		return index
+
+class CostStats(Generic[MissedCounter]):
+	def __init__(self, new_counter: Callable[[], MissedCounter])->None:
+		self.words: int=0
+		self.syllables: int=0
+		# words typeable by a simple stroke
+		self.strokes: int=0
+		self.brief_strokes: int=0
+		self.disambiguated_brief_strokes: int=0
+		# brief strokes that type another word than the first one of the brief
+		self.briefed_syllables: int=0
+		self.missed: MissedCounter=new_counter()
+		# {bigram: count} of adjacent syllables typed by simple strokes that have no brief
+
+	def update(self, other: "CostStats[MissedCounter]")->None:
+		self.words+=other.words
+		self.syllables+=other.syllables
+		self.strokes+=other.strokes
+		self.brief_strokes+=other.brief_strokes
+		self.disambiguated_brief_strokes+=other.disambiguated_brief_strokes
+		self.briefed_syllables+=other.briefed_syllables
+		self.missed.update(other.missed)
+
+	def add_run(self, run: List[str], system: System)->None:
+		"""
+		Add the cost of a run of syllables (NFC-normalized) typed without anything in between.
+		"""
+		count=len(run)
+		if not count:
+			return
+		infinity=count+1
+		cost: List[int]=[0]+[infinity]*count
+		# cost[i]: minimum number of strokes to type run[:i]
+		choice: List[Tuple[int, int]]=[(0, -1)]*(count+1)
+		# choice[i]: (number of words of the last stroke, brief index or -1 for a simple stroke)
+		brief_index=system.brief_index
+		longest=system.longest
+		for end in range(1, count+1):
+			cost[end]=cost[end-1]+1
+			choice[end]=(1, -1)
+			for length in range(2, min(longest, end)+1):
+				if cost[end-length]+1<=cost[end]:
+					index=brief_index(" ".join(run[end-length:end]))
+					if index is not None:
+						cost[end]=cost[end-length]+1
+						choice[end]=(length, index)
+
+		self.syllables+=count
+		self.strokes+=cost[count]
+		end=count
+		simple_after=False
+		# whether run[end] is typed by a simple stroke
+		while end:
+			length, index=choice[end]
+			if index<0:
+				if simple_after:
+					bigram=run[end-1]+" "+run[end]
+					if brief_index(bigram) is None:
+						self.missed.update((bigram.lower(),))
+				simple_after=True
+			else:
+				self.brief_strokes+=1
+				self.disambiguated_brief_strokes+=index>0
+				self.briefed_syllables+=length
+				simple_after=False
+			end-=length
+
+	def add_words(self, words: Iterable[Tuple[str, bool]], system: System)->None:
+		"""
+		words: as returned by bigram_frequency.iterate_words.
+		"""
+		syllables=system.syllables
+		run: List[str]=[]
+		for word, joined in words:
+			self.words+=1
+			word=unicodedata.normalize("NFC", word)
+			typeable=word.lower() in syllables
+			if not joined or not typeable:
+				self.add_run(run, system)
+				run=[]
+			if typeable:
+				run.append(word)
+		self.add_run(run, system)
+
+	def report(self, top: int)->Dict[str, object]:
+		if isinstance(self.missed, SpaceSaving):
+			top_missed=[[bigram, count] for bigram, count, error in self.missed.most_common(top)]
+		else:
+			top_missed=[[bigram, count] for bigram, count in self.missed.most_common(top)]
+		return {
+				"words": self.words,
+				"syllables": self.syllables,
+				"strokes": self.strokes,
+				"strokes_per_syllable": self.strokes/max(1, self.syllables),
+				"brief_strokes": self.brief_strokes,
+				"disambiguated_brief_strokes": self.disambiguated_brief_strokes,
+				"briefed_syllables": self.briefed_syllables,
+				"top_missed_bigrams": top_missed,
+				}
+
+worker_system: Optional[System]=None
+
+def initialize_worker(system: System)->None:
+	global worker_system
+	worker_system=system
+
+def cost_task(task: Task, chunk_size: int, new_counter: Callable[[], MissedCounter])->CostStats[MissedCounter]:
+	assert worker_system is not None
+	result=CostStats(new_counter)
+	result.add_words(iterate_words(read_task_chunks(task, chunk_size)), worker_system)
+	return result
+
+def cost_tasks(tasks: List[Task], system: System, chunk_size: int, jobs: int,
+		new_counter: Callable[[], MissedCounter])->CostStats[MissedCounter]:
+	result=CostStats(new_counter)
+	if jobs==1:
+		for task in tasks:
+			result.add_words(iterate_words(read_task_chunks(task, chunk_size)), system)
+		return result
+	with multiprocessing.Pool(jobs, initialize_worker, (system,)) as pool:
+		for stats in pool.imap(functools.partial(cost_task, chunk_size=chunk_size, new_counter=new_counter), tasks):
+			result.update(stats)
+	return result
+
+
+if __name__=="__main__":
+	import argparse
+
+	parser=argparse.ArgumentParser(
+			formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+			usage="Compute the optimal number of strokes to type the input files with the current system "
+			"(the brief files in the Plover configuration directory, see plover_vi.config), "
+			"output a JSON report to stdout."
+			)
+	parser.add_argument("files", nargs="*", default=["-"],
+			help="Input files (.bz2 files are decompressed). '-' means stdin")
+	parser.add_argument("--chunk-size", type=int, default=1<<16,
+			help="Number of characters (or bytes, for split files) to read at a time")
+	parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+			help="Number of worker processes")
+	parser.add_argument("--split-size", type=int, default=1<<24,
+			help="Split uncompressed input files into byte ranges of approximately this size, "
+			"to be processed in parallel. Ranges are split after a punctuation character, "
+			"so the result is the same as without splitting")
+	parser.add_argument("--top", type=int, default=100,
+			help="Number of most common missed bigrams (typed by two simple strokes, with no brief) to report")
+	parser.add_argument("--capacity", type=int, default=None,
+			help="Count the missed bigrams approximately, keeping track of this many. "
+			"Each takes roughly 200 bytes, the larger the more accurate. By default they're counted exactly")
+	args=parser.parse_args()
+
+	tasks: List[Task]=[task for path in args.files for task in split_file(path, args.split_size)]
+	start_time=time.perf_counter()
+	system=System.load()
+	load_time=time.perf_counter()-start_time
+	result: CostStats
+	if args.capacity is None:
+		result=cost_tasks(tasks, system, args.chunk_size, args.jobs, Counter)
+	else:
+		result=cost_tasks(tasks, system, args.chunk_size, args.jobs, functools.partial(SpaceSaving, args.capacity))
+	elapsed=time.perf_counter()-start_time-load_time
+	json.dump(result.report(args.top), sys.stdout, indent=1, ensure_ascii=False)
+	print(f"\nloaded the system in {load_time:.3f} s, {result.words} words in {elapsed:.3f} s "
+			f"({result.words/max(elapsed, 1e-9):.0f} words/s)", file=sys.stderr)
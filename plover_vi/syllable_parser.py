@@ -0,0 +1,201 @@
+#!/bin/python
+"""
+Split a written syllable into its parts by rule, without the decompose table.
+
+The tone mark is removed first (it only changes one vowel letter), then the toneless syllable is split
+into the leading consonants, the vowels and the trailing consonants, and each written part is mapped
+back to the parts it can be spelled from, undoing the spelling rules of construct:
+	onset: c/k, g/gh and ng/ngh have two spellings; gi shares its i with a nucleus that starts with i;
+		q is also written for c/k before uy with a coda; y is written without onset
+	nucleus: "x/y" is written x without coda and y with a coda; ă is written a before the coda u/y;
+		after q, a leading o is written u and uy before i/y is written ui; i before i/y is written y
+	coda: o/u and i/y have two spellings (and i/y may not be written at all, see above)
+This gives a few candidate (onset, nucleus, coda), which are checked by spelling them again with construct
+(which also checks the tone and its position).
+Apart from a few small tables of spellings, nothing is enumerated, and the time is linear in the length of the word.
+
+The result agrees exactly with decompose.decompose (check() verifies it), additionally
+uppercase and NFD-normalized text are accepted.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from plover_vi import library
+from plover_vi.library import construct, onsets, nucleuses, codas, tones, split_tone_table
+from plover_vi.decompose import SyllableParts
+
+toned_vowel_pattern=re.compile("[%s]"%"".join(
+		char for char, (vowel, tone) in split_tone_table.items() if tone!='LEVEL'))
+strip_tone_translation=str.maketrans({char: vowel for char, (vowel, tone) in split_tone_table.items()})
+
+vowel_letters: str="aăâeêioôơuưy"
+syllable_pattern=re.compile(f"([^{vowel_letters}]*)([{vowel_letters}]+)([^{vowel_letters}]*)")
+# toneless syllable: onset consonants, vowels, coda consonants
+
+Spellings=Dict[str, Tuple[str, ...]]
+# {written form: parts it can be spelled from}
+
+def spellings(parts: List[str])->Spellings:
+	"""
+	{form: parts} where "x/y" is spelled x or y.
+	"""
+	result: Dict[str, List[str]]={}
+	for part in parts:
+		for form in part.split('/'):
+			if form:
+				result.setdefault(form, []).append(part)
+	return {form: tuple(parts) for form, parts in result.items()}
+
+def add_spellings(table: Spellings, extra: Dict[str, List[str]])->Spellings:
+	return {form: tuple(dict.fromkeys((*table.get(form, ()), *extra.get(form, ()))))
+			for form in {*table, *extra}}
+
+onset_spellings: Spellings=add_spellings(spellings(onsets), {
+	'': ['', 'y'],
+	'g': ['gi'],
+	'q': ['c/k'],
+	})
+
+coda_spellings: Spellings=add_spellings(spellings(codas), {
+	'': ['', 'i/y'],
+	})
+
+def respell(table: Spellings, rule)->Spellings:
+	"""
+	Add the spellings given by rule(form) (or None if the rule doesn't apply) for each form of table.
+	"""
+	extra: Dict[str, List[str]]={}
+	for form, parts in table.items():
+		new_form=rule(form)
+		if new_form is not None:
+			extra.setdefault(new_form, []).extend(parts)
+	return add_spellings(table, extra)
+
+nucleus_spellings: Spellings=spellings(nucleuses)
+nucleus_spellings=respell(nucleus_spellings, lambda form: form[:-1]+'a' if form.endswith('ă') else None)
+nucleus_spellings=respell(nucleus_spellings, lambda form: 'u'+form[1:] if form.startswith('o') else None)
+nucleus_spellings=respell(nucleus_spellings, lambda form: 'y'+form[1:] if form.startswith('i') else None)
+nucleus_spellings=add_spellings(nucleus_spellings, {'ui': ['uy']})
+
+Candidate=Tuple[str, str, str]
+
+def candidate_order(candidate: Candidate)->Tuple[int, int, int]:
+	"""
+	Order in which decompose.build enumerates the candidates. It prefers the last one.
+	"""
+	onset, nucleus, coda=candidate
+	return onsets.index(onset), nucleuses.index(nucleus), codas.index(coda)
+
+def sort_parts(table: Spellings, parts: List[str])->Spellings:
+	"""
+	Sort the parts of each spelling in table, most preferred (last in parts) first.
+	"""
+	return {form: tuple(sorted(spelled, key=parts.index, reverse=True)) for form, spelled in table.items()}
+
+onset_spellings=sort_parts(onset_spellings, onsets)
+nucleus_spellings=sort_parts(nucleus_spellings, nucleuses)
+coda_spellings=sort_parts(coda_spellings, codas)
+
+def candidates(syllable: str)->List[Candidate]:
+	"""
+	Return the (onset, nucleus, coda) that the toneless syllable may be spelled from, some of which may be invalid,
+	most preferred first.
+	"""
+	match=syllable_pattern.fullmatch(syllable)
+	if match is None:
+		return []
+	onset_form, vowels, coda_form=match.groups()
+
+	rimes: List[Tuple[str, str, str]]=[]
+	# (onset form, nucleus form, coda form)
+	splits=[(vowels, coda_form)]
+	if not coda_form and len(vowels)>1:
+		splits.append((vowels[:-1], vowels[-1]))
+	for nucleus_form, coda_form_ in splits:
+		rimes.append((onset_form, nucleus_form, coda_form_))
+		if onset_form=='g' and nucleus_form[0]=='i':
+			# the i of gi is not repeated
+			if len(nucleus_form)>1:
+				rimes.append(('gi', nucleus_form[1:], coda_form_))
+
+	result: List[Candidate]=[]
+	for onset_form, nucleus_form, coda_form_ in rimes:
+		for onset in onset_spellings.get('g' if onset_form=='gi' else onset_form, ()):
+			if onset_form=='gi' and onset!='gi' or onset=='y' and nucleus_form[0]!='y':
+				continue
+			for nucleus in nucleus_spellings.get(nucleus_form, ()):
+				for coda in coda_spellings.get(coda_form_, ()):
+					if coda_form_=='' and coda=='i/y' and nucleus_form not in ('y', 'ui'):
+						# i/y is only unwritten after these
+						continue
+					result.append((onset, nucleus, coda))
+	if len(rimes)>1:
+		result.sort(key=candidate_order, reverse=True)
+	# the parts in each table of spellings are sorted, so the candidates of a single rime already are
+	return result
+
+def parse(word: str)->Optional[SyllableParts]:
+	"""
+	Return the parts of word (which may be uppercase or not NFC-normalized), or None if it's not a syllable.
+	Same as decompose.decompose.get(word.lower()) for NFC-normalized word.
+	"""
+	word=unicodedata.normalize('NFC', word).lower()
+	match=toned_vowel_pattern.search(word)
+	if match is None:
+		tone='LEVEL'
+	else:
+		tone=split_tone_table[match.group()][1]
+		if toned_vowel_pattern.search(word, match.end()):
+			return None
+
+	found=candidates(word.translate(strip_tone_translation))
+	for new_tone_placement in (True, False):
+		for candidate in found:
+			if construct(*candidate, tone, new_tone_placement)==word:
+				return SyllableParts(*candidate, tone, new_tone_placement)
+	return None
+
+def check(decompose: Dict[str, SyllableParts])->None:
+	"""
+	Check that parse agrees with decompose on every syllable and its case and normalization variants,
+	and returns None for strings that are not syllables.
+	"""
+	skeletons=set()
+	for word, parts in decompose.items():
+		assert parse(word)==parts, (word, parse(word), parts)
+		assert parse(word.upper())==parts, word
+		assert parse(unicodedata.normalize('NFD', word.capitalize()))==parts, word
+		skeletons.add(word.translate(strip_tone_translation))
+
+	for skeleton in skeletons:
+		for index in range(len(skeleton)):
+			for tone in tones:
+				char=library.add_tone_table.get((skeleton[index], tone))
+				if char is not None:
+					word=skeleton[:index]+char+skeleton[index+1:]
+					assert parse(word)==decompose.get(word), (word, parse(word), decompose.get(word))
+					for other_index in range(len(skeleton)):
+						if other_index!=index and tone!='LEVEL':
+							other=library.add_tone_table.get((word[other_index], 'ACUTE'))
+							if other is not None:
+								word2=word[:other_index]+other+word[other_index+1:]
+								assert parse(word2) is None, word2
+		for extra in ('a', 'n', 'g', 'h'):
+			for word in (skeleton+extra, extra+skeleton):
+				assert parse(word)==decompose.get(word), (word, parse(word), decompose.get(word))
+	for word in ('', 'x', 'aa', 'bac', 'gì ', 'ka', 'quy1'):
+		assert parse(word)==decompose.get(word), word
+
+
+if __name__=="__main__":
+	import time
+	from plover_vi.decompose import decompose
+
+	check(decompose)
+	print(f"agrees with decompose on {len(decompose)} syllables")
+	words=list(decompose)
+	start_time=time.perf_counter()
+	for word in words:
+		parse(word)
+	print(f"{(time.perf_counter()-start_time)/len(words)*1e6:.2f} us per syllable")